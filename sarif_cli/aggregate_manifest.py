@@ -0,0 +1,322 @@
+"""Manifest of the scans merged into an incremental aggregate.
+
+`sarif-aggregate-scans --incremental` keeps every table of the aggregate as a
+dataset (see table_io) of part files, each holding the rows of up to PART_SIZE
+.scantables directories,
+
+    results/part-00000.csv  results/part-00001.csv  ...
+
+With --partition-by, the parts are kept in hive-style partition directories
+named after the values of the partition keys (PARTITION_KEYS) of the
+directories' scans, e.g.
+
+    results/project_id=1234/tool_version=2.7.6/part-00003.parquet
+
+Partition keys that are columns of a table (e.g. scans.project_id) are left
+out of its part files, so that hive readers such as pyarrow.dataset and
+pd.read_parquet do not find the column twice; table_io puts them back on
+reading.  Values are %-quoted, and a missing value becomes
+__HIVE_DEFAULT_PARTITION__.
+
+manifest.json records, for every merged .scantables directory,
+
+    mtime       the latest st_mtime_ns of its tables
+    scan_ids    the ids in its scans table
+    partition   the partition directory of its parts, "" without partitioning
+    part        the part holding its rows
+    rows        {table : [start, stop]}, its rows in that part
+
+A later run reads only the directories that are new or whose tables changed
+since, writes their rows into new parts, and drops their old rows by copying
+the other rows of the parts that held them into new parts.  Only the
+partitions of changed directories are touched.
+
+The manifest is written after all parts.  Part files it does not refer to are
+left over from an interrupted run and are deleted when it is loaded.
+"""
+import collections
+import json
+import os
+import re
+import urllib.parse
+
+import pandas as pd
+
+from sarif_cli import table_io
+
+MANIFEST = "manifest.json"
+
+# Directories per part
+PART_SIZE = 1000
+
+# Partitions with parts open for writing at the same time; each holds a file
+# per table
+MAX_OPEN_PARTITIONS = 64
+
+# The partition keys and their value for the tables of a .scantables directory
+PARTITION_KEYS = {
+    "project_id" : lambda tables: _first(tables["scans"]["project_id"]),
+    "project_name" : lambda tables: _first(tables["projects"]["project_name"]),
+    "tool_name" : lambda tables: _first(tables["scans"]["tool_name"]),
+    "tool_version" : lambda tables: _first(tables["scans"]["tool_version"]),
+    "scan_date" : lambda tables: _first(tables["scans"]["scan_start_date"].dt
+                                         .strftime("%Y-%m-%d")),
+}
+
+_part_name = re.compile(r"part-(\d+)\.")
+
+def _first(column):
+    return column.iloc[0] if len(column) > 0 else None
+
+def partition_dir(partition_by, tables):
+    """ The partition directory, relative to a table's dataset, for `tables`
+    read from one .scantables directory.
+    """
+    parts = []
+    for key in partition_by:
+        value = PARTITION_KEYS[key](tables)
+        if value is None or pd.isna(value) or str(value) == "":
+            value = table_io.DEFAULT_PARTITION
+        else:
+            value = urllib.parse.quote(str(value), safe="")
+        parts.append("{}={}".format(key, value))
+    return "/".join(parts)
+
+def parse_partition_by(spec):
+    """ Parse the comma-separated partition keys `spec` into a list.
+    """
+    keys = [key.strip() for key in spec.split(",") if key.strip()]
+    for key in keys:
+        if key not in PARTITION_KEYS:
+            raise ValueError("unknown partition key '{}'; choose from {}"
+                             .format(key, ", ".join(PARTITION_KEYS)))
+    if len(set(keys)) != len(keys):
+        raise ValueError("partition keys repeated in '{}'".format(spec))
+    return keys
+
+def tables_mtime(directory, names):
+    """ The latest st_mtime_ns of the tables `names` in `directory`, or None if
+    any of them is missing.
+    """
+    mtimes = []
+    for name in names:
+        found = table_io.find_table(directory, name)
+        if found is None:
+            return None
+        mtimes.append(os.stat(found[0]).st_mtime_ns)
+    return max(mtimes)
+
+def read_if_changed(source, names):
+    """ Read the tables of `source`, a (directory, known mtime) pair.
+
+    Return (mtime, tables), with tables None when they are missing or their
+    mtime is the known one.
+    """
+    directory, known_mtime = source
+    mtime = tables_mtime(directory, names)
+    if mtime is None or mtime == known_mtime:
+        return mtime, None
+    return mtime, table_io.read_tables(directory, names)
+
+class AggregateManifest:
+    """ The manifest of the incremental aggregate of `tables` in
+    `aggregate_dir`, written in format `fmt` and partitioned by the keys
+    `partition_by`.
+    """
+    def __init__(self, aggregate_dir, tables, fmt="csv", partition_by=()):
+        self.aggregate_dir = aggregate_dir
+        self.tables = list(tables)
+        self.fmt = fmt
+        self.partition_by = list(partition_by)
+        self.sources = {}
+        for table in self.tables:
+            for other_fmt in table_io.FORMATS:
+                if os.path.exists(table_io.table_file(aggregate_dir, table, other_fmt)):
+                    raise ValueError(
+                        "{} holds a complete (not incremental) aggregate"
+                        .format(aggregate_dir))
+        fname = os.path.join(aggregate_dir, MANIFEST)
+        if os.path.exists(fname):
+            with open(fname) as fh:
+                content = json.load(fh)
+            if content["format"] != fmt:
+                raise ValueError(
+                    "{} holds a {} aggregate; use --output-format {}"
+                    .format(aggregate_dir, content["format"], content["format"]))
+            if content.get("partition_by", []) != self.partition_by:
+                raise ValueError(
+                    "{} is partitioned by '{}'; use the same --partition-by"
+                    .format(aggregate_dir, ",".join(content.get("partition_by", []))))
+            self.sources = content["sources"]
+        self._remove_unlisted_parts()
+
+    def mtime(self, directory):
+        """ The recorded mtime of `directory`, None if it is not merged yet.
+        """
+        entry = self.sources.get(directory)
+        return None if entry is None else entry["mtime"]
+
+    def part_writer(self, part_size=PART_SIZE):
+        return PartWriter(self, part_size)
+
+    def update(self, entries):
+        """ Make `entries`, as collected by a PartWriter, part of the aggregate.
+
+        Rows merged earlier from the same directories are dropped.
+        """
+        replaced = set(entries) & set(self.sources)
+        self._drop_rows(replaced)
+        for directory in replaced:
+            del self.sources[directory]
+        self.sources.update(entries)
+        self._save()
+        self._remove_unlisted_parts()
+
+    def _part_file(self, table, partition, part):
+        return table_io.table_file(os.path.join(self.aggregate_dir, table, partition),
+                                   "part-{:05d}".format(part), self.fmt)
+
+    def _parts_on_disk(self):
+        parts = {}
+        for table in self.tables:
+            dataset = os.path.join(self.aggregate_dir, table)
+            if not os.path.isdir(dataset):
+                continue
+            for fname in table_io.dataset_files(dataset):
+                match = _part_name.match(os.path.basename(fname))
+                if match:
+                    parts.setdefault(int(match.group(1)), []).append(fname)
+        return parts
+
+    def _next_part(self):
+        used = set(self._parts_on_disk()) | {e["part"] for e in self.sources.values()}
+        return max(used, default=-1) + 1
+
+    def _drop_rows(self, directories):
+        # Copy the rows of the other directories in the parts holding rows of
+        # `directories` into new parts.  The old parts are no longer listed
+        # once the entries are updated.
+        writer = self.part_writer()
+        for part in sorted({self.sources[d]["part"] for d in directories}):
+            kept = sorted(((d, e) for d, e in self.sources.items()
+                           if e["part"] == part and d not in directories),
+                          key=lambda item: item[1]["rows"][self.tables[0]][0])
+            if not kept:
+                continue
+            partition = kept[0][1].get("partition", "")
+            frames = {table : table_io.read_table_file(
+                                  self._part_file(table, partition, part),
+                                  self.fmt, table)
+                      for table in self.tables}
+            for d, e in kept:
+                writer.append(d, e["mtime"],
+                              {table : frames[table].iloc[slice(*e["rows"][table])]
+                               for table in self.tables},
+                              partition)
+        writer.close()
+        self.sources.update(writer.entries)
+
+    def _save(self):
+        fname = os.path.join(self.aggregate_dir, MANIFEST)
+        with open(fname + ".tmp", "w") as fh:
+            json.dump({"format": self.fmt, "tables": self.tables,
+                       "partition_by": self.partition_by,
+                       "sources": self.sources}, fh)
+        os.replace(fname + ".tmp", fname)
+
+    def _remove_unlisted_parts(self):
+        listed = {e["part"] for e in self.sources.values()}
+        for part, fnames in self._parts_on_disk().items():
+            if part not in listed:
+                for fname in fnames:
+                    os.remove(fname)
+                    self._remove_empty_partition(os.path.dirname(fname))
+
+    def _remove_empty_partition(self, directory):
+        # Up to, not including, the table's dataset directory
+        while "=" in os.path.basename(directory):
+            try:
+                os.rmdir(directory)
+            except OSError:
+                return
+            directory = os.path.dirname(directory)
+
+class _OpenPart:
+    """ The writers of one part being written, and its row counts.
+    """
+    def __init__(self, manifest, partition, part):
+        self.part = part
+        self.count = 0
+        self.writers = {}
+        self.rows = {}
+        for table in manifest.tables:
+            directory = os.path.join(manifest.aggregate_dir, table, partition)
+            os.makedirs(directory, mode=0o755, exist_ok=True)
+            self.writers[table] = table_io.TableWriter(
+                directory, "part-{:05d}".format(part), manifest.fmt)
+            self.rows[table] = 0
+
+    def close(self):
+        for writer in self.writers.values():
+            writer.close()
+
+class PartWriter:
+    """ Write the tables of several directories into new parts of `manifest`'s
+    aggregate, starting another part after every `part_size` directories of a
+    partition, and collect their manifest entries.
+
+    Small parts keep the rewriting of a part cheap when a few of its
+    directories change.  At most MAX_OPEN_PARTITIONS parts are open; the
+    least recently used one is finished to make room for another.
+    """
+    def __init__(self, manifest, part_size=PART_SIZE):
+        self.manifest = manifest
+        self.part_size = part_size
+        self.open = collections.OrderedDict()
+        self.next_part = None
+        self.entries = {}
+
+    def _open_part(self, partition):
+        current = self.open.pop(partition, None)
+        if current is not None and current.count < self.part_size:
+            self.open[partition] = current
+            return current
+        if current is not None:
+            current.close()
+        if len(self.open) >= MAX_OPEN_PARTITIONS:
+            self.open.popitem(last=False)[1].close()
+        if self.next_part is None:
+            self.next_part = self.manifest._next_part()
+        current = self.open[partition] = _OpenPart(self.manifest, partition,
+                                                   self.next_part)
+        self.next_part += 1
+        return current
+
+    def append(self, directory, mtime, tables, partition=None):
+        """ Add `tables`, the {name : DataFrame} read from `directory`, to
+        `partition`, by default the one of the tables' partition key values.
+        """
+        if partition is None:
+            partition = partition_dir(self.manifest.partition_by, tables)
+        current = self._open_part(partition)
+        current.count += 1
+        rows = {}
+        for table in self.manifest.tables:
+            # The partition values are in the directory names only
+            frame = tables[table].drop(columns=[key for key in self.manifest.partition_by
+                                                if key in tables[table].columns])
+            rows[table] = [current.rows[table], current.rows[table] + len(frame)]
+            current.writers[table].append(frame)
+            current.rows[table] += len(frame)
+        self.entries[directory] = {
+            "mtime": mtime,
+            "scan_ids": [int(scan_id) for scan_id in tables["scans"]["id"]],
+            "partition": partition,
+            "part": current.part,
+            "rows": rows,
+        }
+
+    def close(self):
+        for current in self.open.values():
+            current.close()
+        self.open.clear()
@@ -0,0 +1,399 @@
+""" Extract scan data from a single sarif file in table form.
+
+This is the body of bin/sarif-extract-scans as an importable function, so that
+sarif-extract-scans-runner can process many files in long-lived worker processes
+instead of paying interpreter startup and module imports for every file.
+"""
+from dataclasses import dataclass
+from sarif_cli import signature, signature_single, signature_single_CLI, \
+    signature_table_joins_CLI
+from sarif_cli import typegraph
+from sarif_cli import snowflake_id
+from sarif_cli import flake_map
+from sarif_cli import status_writer
+from sarif_cli import result_cache
+from sarif_cli import loader
+from sarif_cli import sarif_stream
+from sarif_cli import table_io
+import argparse
+import contextlib
+import dataclasses as dc
+import io
+import json
+import logging
+import os
+import pandas as pd
+import pathlib
+import time
+import traceback
+import sarif_cli.table_joins as tj
+import sarif_cli.table_joins_CLI as tj_CLI
+import sarif_cli.scan_tables as st
+from sarif_cli import columns
+
+class LoadError(Exception):
+    pass
+
+@dataclass
+class RunStats:
+    """ Outcome of run_extract_scan(), shaped like subprocess.CompletedProcess.
+    """
+    args : list                 # equivalent sarif-extract-scans command
+    returncode : int
+    status : str                # OK, FAIL, TIMEOUT or MEMORY
+    stderr : str
+    duration : float            # seconds
+    peak_rss : int              # kB, or None if unknown
+
+#
+# Dataframe / table collection
+#
+@dataclass
+class BaseTables:
+    artifacts : pd.DataFrame
+    codeflows : pd.DataFrame
+    kind_pathproblem : pd.DataFrame
+    kind_problem : pd.DataFrame
+    project : pd.DataFrame
+    relatedLocations : pd.DataFrame
+    rules : pd.DataFrame
+    columns_to_reindex : dict   # (name -> name list) dict
+    def __init__(self): pass
+
+@dataclass
+class ScanTables:
+    # project: External table with project information
+    scans : pd.DataFrame
+    results : pd.DataFrame
+    projects : pd.DataFrame
+    columns_to_reindex : dict   # (name -> name list) dict
+    def __init__(self): pass
+
+@dataclass
+class ExternalInfo:
+    project_id: pd.UInt64Dtype()
+    scan_id : pd.UInt64Dtype()
+    sarif_file_name : str
+
+def init_worker(json_backend, worker_pids, process_id_base=0):
+    """ Initializer of the sarif-extract-scans-runner worker processes.
+
+    Starts the worker's own snowflake generator; every extract_scan() call in
+    the worker draws from it, so ids stay unique across the files it handles.
+    `worker_pids` is a multiprocessing.Array with a slot per worker of one
+    pool, shared by its workers.  Each worker records its pid in the first
+    free slot, for the runner to kill it by, and its process id is
+    `process_id_base` plus the slot's index, so concurrent workers use
+    distinct ids.
+    """
+    loader.set_backend(json_backend)
+    with worker_pids.get_lock():
+        index = list(worker_pids).index(0)
+        worker_pids[index] = os.getpid()
+    snowflake_id.set_process_id(
+        (process_id_base + index) % snowflake_id.Snowflake.process_id_max)
+
+def _load_error(fname, err):
+    logging.error('Error reading from {}: {}: line {}, column {}'
+                  .format(fname, err.msg, err.lineno, err.colno))
+    status_writer.file_load_error["sarif_file"] = fname
+    status_writer.csv_write(status_writer.file_load_error)
+    return LoadError(fname)
+
+def load(fname):
+    """ Load the json file `fname`, recording failures in the status csv.
+    """
+    with loader.open_input(fname, 'rb') as fp:
+        try:
+            content = loader.load(fp)
+        except json.decoder.JSONDecodeError as err:
+            raise _load_error(fname, err) from err
+        return content
+
+def destructure_sarif(tgraph, start_node, fname, fill):
+    """ Read the sarif file `fname` into `tgraph`, see sarif_stream.destructure_file().
+
+    Invalid json is handled as in load().
+    """
+    try:
+        sarif_stream.destructure_file(tgraph, start_node, fname, fill)
+    except json.decoder.JSONDecodeError as err:
+        raise _load_error(fname, err) from err
+
+def extract_scan(scan_spec_file, outdir, csvout, input_signature="CLI",
+                 with_timestamps=False, write_raw_tables=False, cache_dir=None,
+                 output_format="csv"):
+    """ Produce the scan tables for the sarif file named in `scan_spec_file`.
+
+    Arguments correspond to those of bin/sarif-extract-scans.  The processing
+    status is written to `csvout`.csv and the tables to `outdir`, in
+    `output_format` (see table_io).  With a `cache_dir`, tables for previously
+    seen content are taken from the result_cache instead of being recomputed.  Raises LoadError for unreadable
+    json input; other failures propagate.
+    """
+    # Setup csv error writer
+    status_writer.setup_csv_writer(csvout)
+
+    # Load meta info
+    scan_spec = load(scan_spec_file)
+    if with_timestamps:
+        t1 = load(scan_spec['timestamp_file_name'])
+        # TODO Remove this kludge for wrong keywords.
+        timestamps = {
+            **t1,
+            "scan_start_date" : t1["scan_start"],
+            "scan_stop_date"  : t1["scan_stop"],
+        }
+    else:
+        timestamps = {
+            "db_create_start"      : pd.Timestamp(0.0, unit='s'),
+            "db_create_stop"       : pd.Timestamp(0.0, unit='s'),
+            "scan_start_date"      : pd.Timestamp(0.0, unit='s'),
+            "scan_stop_date"       : pd.Timestamp(0.0, unit='s'),
+        }
+
+    # The raw tables are not cached, so they always need the full run
+    cache = None
+    if cache_dir is not None and not write_raw_tables:
+        cache = result_cache.ResultCache(cache_dir, output_format)
+        if cache.fetch(scan_spec['scan_id'], input_signature, outdir, csvout,
+                       scan_spec['sarif_file_name'], timestamps):
+            return
+
+    status_writer.setup_status_filenames(scan_spec['sarif_file_name'])
+
+    #
+    # Preprocess raw SARIF to get smaller signature
+    #
+    context = signature.Context(
+        {
+            "string" : "String",
+            "int" : "Int",
+            "bool" : "Bool"
+        }
+    )
+    args = argparse.Namespace(input_signature=input_signature,
+                              with_timestamps=with_timestamps,
+                              write_raw_tables=write_raw_tables)
+
+    #
+    # Setup which signature to use
+    if input_signature == "LGTM":
+        signature_to_use = signature_single.struct_graph_LGTM
+        start_node = signature_single.start_node_LGTM
+    else:
+        signature_to_use = signature_table_joins_CLI.struct_graph_CLI
+        start_node = signature_single_CLI.start_node_CLI
+
+    #
+    # Use reference type graph (signature) to traverse sarif and attach values
+    # to tables.  The results are read, filled and destructured one at a time.
+    try:
+        tgraph = typegraph.Typegraph(signature_to_use)
+        destructure_sarif(tgraph, start_node, scan_spec['sarif_file_name'],
+                          lambda tree: signature.fillsig(args, tree, context))
+    except LoadError:
+        raise
+    except Exception:
+        # will have gathered errors/warnings
+        status_writer.csv_write_warnings()
+        #pass the exception up to be put into log by runner
+        raise
+
+    #
+    # Form output tables
+    #
+    typegraph.attach_tables(tgraph)
+
+    bt = BaseTables()
+    scantabs = ScanTables()
+    external_info = ExternalInfo(
+        pd.NA,
+        scan_spec["scan_id"],
+        scan_spec["sarif_file_name"]
+    )
+
+    #
+    # Add dataframes for base tables
+    #
+    # (relies on some specifics of the sigature type)
+    if input_signature == "LGTM":
+        joins = tj
+    else:
+        joins = tj_CLI
+    try:
+        location_info = joins.joins_for_location_info(tgraph)
+        af_0350_location = joins.joins_for_af_0350_location(tgraph)
+        bt.artifacts = joins.joins_for_artifacts(tgraph)
+        bt.codeflows = joins.joins_for_codeflows(tgraph, location_info)
+        bt.kind_pathproblem = joins.joins_for_path_problem(tgraph, af_0350_location)
+        bt.kind_problem = joins.joins_for_problem(tgraph, af_0350_location)
+        bt.project = joins.joins_for_project_single(tgraph)
+        bt.relatedLocations = joins.joins_for_relatedLocations(tgraph, location_info)
+        bt.rules = joins.joins_for_rules(tgraph)
+    except Exception:
+        #possible warnings accumulated
+        status_writer.csv_write_warnings()
+        raise
+
+    #
+    # Setup rest of basetables
+    #
+    bt.columns_to_reindex = {
+        # template from {field.name : [''] for field in dc.fields(bt)}
+        'artifacts': ['artifacts_id'],
+        'codeflows': ['codeflow_id'],
+        'kind_pathproblem': ['results_array_id', 'codeFlows_id'],
+        'kind_problem': ['results_array_id'],
+        'project': ['artifacts', 'results', 'rules'],
+        'relatedLocations': ['struct_id'],
+        'rules': ['rules_array_id']}
+
+    scantabs.columns_to_reindex = {
+        'scans': [],
+        'projects' : [],
+        'results': ['codeFlow_id'],
+        }
+
+    #
+    # Form scan tables
+    #
+    # joins for projects has to happen first as it backfills the guess about the project_id
+    scantabs.projects = st.joins_for_projects(bt, external_info)
+    scantabs.results = st.joins_for_results(bt, external_info)
+    scantabs.scans = \
+        st.joins_for_scans(bt, external_info, scantabs,
+                           input_signature, timestamps)
+
+    #
+    # Replace the remaining internal ids with snowflake ids
+    #
+    # The typegraph's ids are only unique within this call, so the map is too.
+    flakes = flake_map.FlakeMap(snowflake_id.generator())
+
+    # Replace node ids of the base and derived tables
+    flake_map.replace_ids(bt, bt.columns_to_reindex, flakes)
+    flake_map.replace_ids(scantabs, scantabs.columns_to_reindex, flakes)
+
+    #
+    # Write output
+    #
+    p = pathlib.Path(outdir)
+    p.mkdir(exist_ok=True)
+
+    def write(path, frame):
+        table_io.write_table(p, path, frame, output_format,
+                             columns=columns.columns[path])
+
+    def _write_dataframes_of(tables_dataclass):
+        for field in dc.fields(tables_dataclass):
+            if field.type != pd.DataFrame:
+                continue
+            table = getattr(tables_dataclass, field.name)
+            write(field.name, table)
+
+    # Write sarif-based tables
+    if write_raw_tables:
+        _write_dataframes_of(bt)
+
+    # Write derived tables and codeflows
+    _write_dataframes_of(scantabs)
+
+    write('codeflows', bt.codeflows)
+    status_writer.warning_set["success"]+=1
+    status_writer.csv_write_warnings()
+
+    if cache is not None:
+        cache.store(scan_spec['scan_id'], input_signature, outdir, csvout)
+
+def _reset_peak_rss():
+    # Linux only; elsewhere the peak covers the whole process lifetime.
+    try:
+        with open('/proc/self/clear_refs', 'w') as fp:
+            fp.write('5')
+    except OSError:
+        pass
+
+def _peak_rss():
+    try:
+        with open('/proc/self/status') as fp:
+            for line in fp:
+                if line.startswith('VmHWM:'):
+                    return int(line.split()[1])
+    except OSError:
+        pass
+    try:
+        import resource
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    except ImportError:
+        return None
+
+def _vm_size():
+    try:
+        with open('/proc/self/status') as fp:
+            for line in fp:
+                if line.startswith('VmSize:'):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    return 0
+
+@contextlib.contextmanager
+def _memory_limit(max_memory):
+    """ Let the enclosed code grow the address space by at most `max_memory` MB.
+
+    This is RLIMIT_AS, a limit on virtual memory (VmSize), not on resident
+    memory: numpy, pandas and pyarrow reserve address space well beyond what
+    they touch, so a file can hit the limit with a much smaller RSS.  Choose
+    `max_memory` generously, as a guard against runaway files rather than a
+    precise RSS budget.  Exceeding it raises MemoryError instead of exhausting
+    the host.  Unix only.
+    """
+    if max_memory is not None:
+        import resource
+        old_limit = resource.getrlimit(resource.RLIMIT_AS)
+        resource.setrlimit(resource.RLIMIT_AS,
+                           (_vm_size() + max_memory * 1024 * 1024, old_limit[1]))
+    try:
+        yield
+    finally:
+        if max_memory is not None:
+            resource.setrlimit(resource.RLIMIT_AS, old_limit)
+
+def run_extract_scan(cmd, *args, max_memory=None, **kwargs):
+    """ Run extract_scan() in this process and report like subprocess.run().
+
+    Logging output and tracebacks are captured and returned as the stderr of a
+    RunStats, together with the run time and peak memory; `cmd` is the
+    equivalent sarif-extract-scans command line.  `max_memory` (MB) optionally
+    limits the run, see _memory_limit(); a file stopped at the limit gets
+    status MEMORY.  The time limit is kept by the caller, which can stop a
+    worker even inside a long C call.  Used as the worker function by
+    sarif-extract-scans-runner.
+    """
+    _reset_peak_rss()
+    start = time.monotonic()
+    stderr = io.StringIO()
+    handler = logging.StreamHandler(stderr)
+    handler.setFormatter(logging.Formatter('%(asctime)s %(message)s'))
+    root_logger = logging.getLogger()
+    root_logger.addHandler(handler)
+    returncode, status = 0, "OK"
+    try:
+        with contextlib.redirect_stderr(stderr):
+            with _memory_limit(max_memory):
+                extract_scan(*args, **kwargs)
+    except LoadError:
+        returncode, status = 1, "FAIL"
+    except MemoryError:
+        traceback.print_exc(file=stderr)
+        stderr.write("Stopped at the memory limit of {} MB\n".format(max_memory))
+        status_writer.csv_write(status_writer.memory_limit)
+        returncode, status = 1, "MEMORY"
+    except Exception:
+        traceback.print_exc(file=stderr)
+        returncode, status = 1, "FAIL"
+    finally:
+        root_logger.removeHandler(handler)
+    return RunStats(cmd, returncode, status, stderr.getvalue(),
+                    time.monotonic() - start, _peak_rss())
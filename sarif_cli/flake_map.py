@@ -0,0 +1,68 @@
+"""Replace the typegraph's node ids in tables with snowflake ids.
+
+The node ids are only unique within one typegraph; before tables are written,
+every id column listed for a table is mapped to snowflake ids.  An id gets the
+same flake in every table and column it appears in, so the links between
+tables survive.
+
+The special values 0 and -1 (no link) are kept as they are.
+"""
+import dataclasses as dc
+import numpy as np
+import pandas as pd
+
+# -1 as found in the uint64 id columns
+_special_ids = np.array([0, -1], dtype=np.int64).astype(np.uint64)
+
+class FlakeMap:
+    """ The (node id -> snowflake id) map, growing as new ids are seen.
+
+    Flakes are handed out in order of first appearance, drawn from `flakegen`.
+    """
+    def __init__(self, flakegen):
+        self.flakegen = flakegen
+        self.ids = pd.Index([], dtype='uint64')
+        self.flakes = np.empty(0, dtype=np.uint64)
+
+    def lookup(self, ids):
+        """ Return the flakes for the uint64 array `ids`.
+        """
+        codes, uniques = pd.factorize(ids)
+        positions = self.ids.get_indexer(uniques)
+        new = positions == -1
+        count = int(new.sum())
+        if count:
+            positions[new] = np.arange(len(self.ids), len(self.ids) + count)
+            self.ids = self.ids.append(pd.Index(uniques[new], dtype='uint64'))
+            self.flakes = np.concatenate([self.flakes, self.flakegen.take(count)])
+        return self.flakes[positions[codes]]
+
+def replace_ids(tables_dataclass, columns_to_reindex, flake_map):
+    """ Replace the ids in the DataFrame fields of `tables_dataclass`.
+
+    `columns_to_reindex` maps each table name to its id columns; these become
+    uint64 and the tables are reindexed to 0..len(table).
+    """
+    tdc = tables_dataclass
+    for field in dc.fields(tdc):
+        if field.type != pd.DataFrame:
+            continue
+        table = getattr(tdc, field.name)
+        # Replace the table
+        setattr(tdc, field.name,
+                replace_frame_ids(table, columns_to_reindex[field.name], flake_map))
+
+def replace_frame_ids(table, colnames, flake_map):
+    """ Return `table` with the ids in columns `colnames` replaced by flakes.
+    """
+    newtable = table.astype(
+        { colname : 'uint64' for colname in colnames }
+    ).reset_index(drop=True)
+    # Swap ids for flakes
+    for colname in colnames:
+        ids = newtable[colname].to_numpy()
+        linked = ~np.isin(ids, _special_ids)
+        flakes = ids.copy()
+        flakes[linked] = flake_map.lookup(ids[linked])
+        newtable[colname] = flakes
+    return newtable
@@ -1,7 +1,52 @@
 from hashlib import blake2b
+import os
+import pickle
+from sarif_cli import loader
+
+# Read size for hash_file(); keeps memory use flat for multi-GB files
+CHUNK_SIZE = 1 << 20
 
 # takes a bytes object and outputs an 8 byte hash
 def hash_unique(item_to_hash):
     h = blake2b(digest_size = 8)
     h.update(item_to_hash)
     return int.from_bytes(h.digest(), byteorder='big')
+
+# takes a file name and outputs the same 8 byte hash as hash_unique() on the
+# file's contents, reading the file in chunks.  Compressed files are hashed
+# by their decompressed content, so the hash does not depend on compression.
+def hash_file(fname, chunk_size=CHUNK_SIZE):
+    h = blake2b(digest_size = 8)
+    with loader.open_input(fname, 'rb') as fp:
+        for chunk in iter(lambda: fp.read(chunk_size), b''):
+            h.update(chunk)
+    return int.from_bytes(h.digest(), byteorder='big')
+
+class FileHashCache:
+    """ Persistent cache of hash_file() results.
+
+    Entries are keyed by (absolute path, size, mtime), so a file is only
+    re-hashed when it has changed.  The cache is pickled to `filename` by
+    save(); an empty filename gives an in-memory cache.
+    """
+    def __init__(self, filename=""):
+        self.filename = filename
+        self._hashes = {}       # (path -> (size, mtime_ns, hash)) dict
+        if filename != "" and os.path.exists(filename):
+            with open(filename, "rb") as infile:
+                self._hashes = pickle.load(infile)
+
+    def hash_file(self, fname):
+        st = os.stat(fname)
+        path = os.path.abspath(fname)
+        entry = self._hashes.get(path)
+        if entry is None or entry[:2] != (st.st_size, st.st_mtime_ns):
+            entry = (st.st_size, st.st_mtime_ns, hash_file(fname))
+            self._hashes[path] = entry
+        return entry[2]
+
+    def save(self):
+        if self.filename == "":
+            return
+        with open(self.filename, 'wb') as outfile:
+            pickle.dump(self._hashes, outfile)
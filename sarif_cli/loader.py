@@ -0,0 +1,135 @@
+"""Json loading with the fastest installed parser.
+
+The backends are tried in the order of BACKENDS; the standard library `json`
+module is always available as the last one.  Scripts offer the choice as
+--json-backend via add_backend_argument(); the default `auto` picks the first
+installed backend.
+
+Decoding errors from every backend are raised as json.JSONDecodeError.
+
+open_input() reads gzip, xz and zstd compressed files transparently; the
+compression is detected from the content, not the file name.  zstd needs the
+`zstandard` module.
+"""
+import argparse
+import gzip
+import importlib
+import io
+import json
+import lzma
+import sys
+
+BACKENDS = ("orjson", "simdjson", "ujson", "json")
+
+_backend_name = None
+_loads = None
+
+def available():
+    """ Names of the installed backends, fastest first.
+    """
+    names = []
+    for name in BACKENDS:
+        try:
+            importlib.import_module(name)
+        except ImportError:
+            continue
+        names.append(name)
+    return names
+
+def set_backend(name="auto"):
+    """ Use backend `name` for all following loads.  Raises ValueError if it
+    is not installed.
+    """
+    global _backend_name, _loads
+    if name == "auto":
+        name = available()[0]
+    if name not in BACKENDS:
+        raise ValueError("unknown json backend '{}'".format(name))
+    try:
+        module = importlib.import_module(name)
+    except ImportError:
+        raise ValueError("json backend '{}' is not installed".format(name))
+    _backend_name, _loads = name, module.loads
+
+def backend():
+    if _backend_name is None:
+        set_backend()
+    return _backend_name
+
+def loads(data):
+    """ Decode the json document in `data`, a str or bytes.
+    """
+    if _loads is None:
+        set_backend()
+    try:
+        return _loads(data)
+    except json.JSONDecodeError:
+        raise
+    except ValueError as err:
+        # simdjson and ujson use plain ValueErrors without a position
+        raise json.JSONDecodeError(str(err), "", 0) from err
+
+def load(fp):
+    return loads(fp.read())
+
+# Leading bytes of the supported compressed formats
+_magic = ((b'\x1f\x8b', 'gzip'),
+          (b'\xfd7zXZ\x00', 'xz'),
+          (b'(\xb5/\xfd', 'zstd'))
+
+def compression(fp):
+    """ 'gzip', 'xz', 'zstd' or None for the buffered binary file `fp`.
+    """
+    head = fp.peek(6)[:6]
+    for magic, kind in _magic:
+        if head.startswith(magic):
+            return kind
+    return None
+
+def open_input(fname, mode='r'):
+    """ Open `fname` (- for stdin) for reading, decompressing if needed.
+
+    `mode` is 'r' for utf-8 text or 'rb'.  Compressed input is decompressed as
+    it is read, so it never needs a temporary file.
+    """
+    if fname == '-':
+        source = sys.stdin.buffer
+        kind = compression(source)
+    else:
+        source = fname
+        with open(fname, 'rb') as fp:
+            kind = compression(fp)
+    # gzip.open() and lzma.open() close only the files they open themselves
+    if kind == 'gzip':
+        fp = gzip.open(source, 'rb')
+    elif kind == 'xz':
+        fp = lzma.open(source, 'rb')
+    elif kind == 'zstd':
+        try:
+            import zstandard
+        except ImportError:
+            raise OSError("{}: reading zstd compressed input needs the "
+                          "zstandard module".format(fname))
+        raw = open(fname, 'rb') if fname != '-' else source
+        fp = io.BufferedReader(zstandard.ZstdDecompressor().stream_reader(
+            raw, read_across_frames=True, closefd=fname != '-'))
+    else:
+        fp = open(fname, 'rb') if fname != '-' else source
+    if mode == 'r':
+        fp = io.TextIOWrapper(fp, encoding='utf-8')
+    return fp
+
+def _backend_type(name):
+    if name != "auto" and name not in available():
+        raise argparse.ArgumentTypeError(
+            "'{}' is not an installed json backend; choose from auto, {}"
+            .format(name, ", ".join(available())))
+    return name
+
+def add_backend_argument(parser):
+    """ Add --json-backend to `parser`; pass its value to set_backend().
+    """
+    parser.add_argument('--json-backend', metavar='backend', type=_backend_type,
+                        default='auto',
+                        help='Json parser to use, one of auto, {}.  Default: auto, '
+                        'the first one installed'.format(', '.join(BACKENDS)))
@@ -0,0 +1,123 @@
+"""Content-addressed cache of the tables produced by extract.extract_scan().
+
+The same sarif content often arrives under several paths.  Its scan_id is a hash
+of that content, so the tables for (scan_id, input signature, FORMAT_VERSION)
+only need to be computed once.  A cache entry is a directory holding
+
+    codeflows.csv  projects.csv  results.csv  scans.csv  status.csv
+
+with the tables in the output format of the cache (see table_io), e.g.
+results.parquet; each format has its own entries.
+
+On a hit these are copied into the new .scantables directory.  The row ids of
+the results and codeflows tables (results.id, results.codeFlow_id and
+codeflows.codeflow_id) are replaced by fresh snowflake ids, so scans served
+from one entry do not share ids in the aggregate.  The scans table and the
+status csv are rewritten as well, because they carry the sarif file name and
+timestamps of the particular copy.  Entries are never written to after they
+are stored, and never linked, so a later write to a .scantables directory
+cannot change them.
+"""
+import csv
+import os
+import shutil
+import tempfile
+
+from sarif_cli import columns
+from sarif_cli import flake_map
+from sarif_cli import scan_tables
+from sarif_cli import snowflake_id
+from sarif_cli import status_writer
+from sarif_cli import table_io
+
+# Bump when the content of the extracted tables changes, to invalidate old entries
+FORMAT_VERSION = 1
+
+_copied_tables = ["codeflows", "projects", "results"]
+
+# The id columns given fresh ids for every copy; results.codeFlow_id links to
+# codeflows.codeflow_id, so both are mapped together
+_reindexed_columns = {
+    "codeflows" : ["codeflow_id"],
+    "projects" : [],
+    "results" : ["id", "codeFlow_id"],
+}
+
+class ResultCache:
+    def __init__(self, cache_dir, output_format="csv"):
+        self.cache_dir = cache_dir
+        self.output_format = output_format
+        os.makedirs(cache_dir, mode=0o755, exist_ok=True)
+
+    def _entry(self, scan_id, input_signature):
+        # csv entries keep the names they had before other formats existed
+        fmt = "" if self.output_format == "csv" else "-" + self.output_format
+        return os.path.join(self.cache_dir, "{:016x}-{}{}-v{}".format(
+            int(scan_id), input_signature, fmt, FORMAT_VERSION))
+
+    def _table(self, directory, table):
+        return table_io.table_file(directory, table, self.output_format)
+
+    def fetch(self, scan_id, input_signature, outdir, csvout, sarif_file_name,
+              timestamps):
+        """ Fill `outdir` and `csvout`.csv from the cache; False on a miss.
+        """
+        entry = self._entry(scan_id, input_signature)
+        if not os.path.isdir(entry):
+            return False
+        os.makedirs(outdir, exist_ok=True)
+        flakes = flake_map.FlakeMap(snowflake_id.generator())
+        for table in _copied_tables:
+            _copy_table(entry, outdir, table, self.output_format, flakes)
+        _write_scans(entry, outdir, self.output_format, sarif_file_name,
+                     timestamps)
+        _write_status(os.path.join(entry, "status.csv"), csvout + ".csv",
+                      sarif_file_name)
+        return True
+
+    def store(self, scan_id, input_signature, outdir, csvout):
+        """ Add the tables just written to `outdir` and `csvout`.csv.
+        """
+        entry = self._entry(scan_id, input_signature)
+        if os.path.isdir(entry):
+            return
+        # Assemble in a private directory and rename, so concurrent workers
+        # never see a partial entry.
+        tmp_entry = tempfile.mkdtemp(dir=self.cache_dir, prefix=".tmp-")
+        for table in _copied_tables + ["scans"]:
+            shutil.copyfile(self._table(outdir, table),
+                            self._table(tmp_entry, table))
+        shutil.copyfile(csvout + ".csv", os.path.join(tmp_entry, "status.csv"))
+        try:
+            os.rename(tmp_entry, entry)
+        except OSError:
+            # another worker stored the same entry first
+            shutil.rmtree(tmp_entry)
+
+def _copy_table(src_dir, dst_dir, table, fmt, flakes):
+    frame = table_io.read_table_file(table_io.table_file(src_dir, table, fmt),
+                                     fmt, table)
+    # Keep the stored column types, e.g. UInt64 ids in parquet
+    frame = (flake_map.replace_frame_ids(frame, _reindexed_columns[table], flakes)
+             .astype(frame.dtypes.to_dict()))
+    table_io.write_table(dst_dir, table, frame, fmt, columns=columns.columns[table])
+
+def _write_scans(src_dir, dst_dir, fmt, sarif_file_name, timestamps):
+    scans = table_io.read_table_file(table_io.table_file(src_dir, "scans", fmt),
+                                     fmt, "scans")
+    scans["sarif_file_name"] = sarif_file_name
+    for col in table_io.csv_dtypes("scans")[1]:
+        scans[col] = timestamps[col]
+    scans = scan_tables.normalize_dataframe_types(scans, scan_tables.ScanTablesTypes.scans)
+    table_io.write_table(dst_dir, "scans", scans, fmt,
+                         columns=columns.columns["scans"])
+
+def _write_status(src, dst, sarif_file_name):
+    with open(src, newline='') as infile:
+        rows = list(csv.DictReader(infile))
+    with open(dst, 'w', newline='') as outfile:
+        writer = csv.DictWriter(outfile, status_writer.fieldnames)
+        writer.writeheader()
+        for row in rows:
+            row["sarif_file"] = sarif_file_name
+            writer.writerow(row)
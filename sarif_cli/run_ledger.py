@@ -0,0 +1,106 @@
+"""Durable record of sarif-extract-scans-runner results.
+
+The ledger is a SQLite database in WAL mode with one row per extraction attempt.
+Every row is committed on its own, so no progress is lost when the runner is
+interrupted, and several runners can share one ledger.
+
+The table can be queried directly, e.g.
+
+    sqlite3 successful-runs "select path, finished from latest
+                             where status = 'FAIL' and finished < '2024-05-01'"
+
+    sqlite3 successful-runs "select path, duration from runs
+                             order by duration desc limit 100"
+
+The `latest` view holds the most recent attempt for every path.  The common
+queries, failed_before() and slowest(), are available as
+
+    sarif-runs-report successful-runs --failed-before 2024-05-01 --slowest 100
+"""
+import os
+import pickle
+import sqlite3
+from datetime import datetime
+
+_schema = """
+create table if not exists runs (
+    path        text not null,
+    scan_id     text,           -- hash.hash_file() of the sarif file, as text
+    status      text not null,  -- OK, FAIL, TIMEOUT, MEMORY
+    finished    text not null,  -- isoformat local time
+    duration    real,           -- seconds
+    peak_rss    integer,        -- kB
+    error_tail  text
+);
+create index if not exists runs_path on runs (path, finished);
+create view if not exists latest as
+    select * from runs r
+    where r.rowid = (select rowid from runs r2 where r2.path = r.path
+                     order by finished desc, rowid desc limit 1);
+"""
+
+_sqlite_header = b"SQLite format 3\x00"
+
+class RunLedger:
+    """ Record and query extraction attempts stored in `filename`.
+    """
+    def __init__(self, filename):
+        self.filename = filename
+        legacy_runs = _read_legacy_pickle(filename)
+        self._conn = sqlite3.connect(filename, timeout=60)
+        self._conn.execute("pragma journal_mode=wal")
+        self._conn.executescript(_schema)
+        if legacy_runs:
+            # Earlier runner versions pickled the set of successful paths here
+            with self._conn:
+                self._conn.executemany(
+                    "insert into runs (path, status, finished) values (?, 'OK', ?)",
+                    [(path, datetime.now().isoformat()) for path in legacy_runs])
+
+    def record(self, path, scan_id, status, duration=None, peak_rss=None,
+               error_tail=None):
+        with self._conn:
+            self._conn.execute(
+                "insert into runs values (?, ?, ?, ?, ?, ?, ?)",
+                (path, None if scan_id is None else str(scan_id), status,
+                 datetime.now().isoformat(), duration, peak_rss, error_tail))
+
+    def successful(self, path, scan_id):
+        """ True if the latest attempt for `path` succeeded on the same content.
+
+        Entries without a scan_id (imported from a pickled set) match any content.
+        """
+        row = self._conn.execute(
+            "select status, scan_id from latest where path = ?", (path,)).fetchone()
+        return (row is not None and row[0] == 'OK' and
+                row[1] in (None, str(scan_id)))
+
+    def failed_before(self, isotime):
+        """ Paths whose latest attempt failed before `isotime`.
+        """
+        return [path for (path,) in self._conn.execute(
+            "select path from latest where status != 'OK' and finished < ?"
+            " order by path", (isotime,))]
+
+    def slowest(self, n):
+        """ (path, duration) of the `n` slowest attempts.
+        """
+        return self._conn.execute(
+            "select path, duration from runs where duration is not null"
+            " order by duration desc limit ?", (n,)).fetchall()
+
+    def close(self):
+        self._conn.close()
+
+def _read_legacy_pickle(filename):
+    """ Move a pickled successful_runs set aside and return its content.
+    """
+    if not os.path.exists(filename) or os.path.getsize(filename) == 0:
+        return None
+    with open(filename, "rb") as infile:
+        if infile.read(len(_sqlite_header)) == _sqlite_header:
+            return None
+        infile.seek(0)
+        legacy_runs = pickle.load(infile)
+    os.replace(filename, filename + ".pickle")
+    return legacy_runs
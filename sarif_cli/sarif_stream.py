@@ -0,0 +1,284 @@
+"""Incremental reading of large sarif files.
+
+json.load() builds the whole file as one Python object graph, many times the
+size of the file.  Almost all of a sarif file is in runs[*].results, so this
+module parses the document in chunks and hands every result to a callback as
+soon as it is complete; everything else in the document is kept.  Peak memory
+then depends on the largest single result, not on the size of the file.
+
+Only the standard library json decoder is used: every json value outside the
+results arrays, and every result, is decoded by JSONDecoder.raw_decode() from
+a window of the file.  That is slower than the fast backends of
+sarif_cli.loader, so destructure_file() only streams documents of STREAM_SIZE
+bytes and more.  A document loaded whole takes 10-20 times its size in
+memory, so the threshold is kept low.
+"""
+import io
+import json
+import re
+from sarif_cli import loader
+from sarif_cli import typegraph
+
+# Characters read from the file at a time
+CHUNK_SIZE = 1 << 20
+
+# Smaller documents are loaded whole, with the loader's json backend
+STREAM_SIZE = 4 << 20
+
+_whitespace = re.compile(r'[ \t\n\r]*')
+
+class _Scanner:
+    """ A window on the json text in `fp` that grows and slides as needed.
+    """
+    def __init__(self, fp, chunk_size=CHUNK_SIZE):
+        self.fp = fp
+        self.chunk_size = chunk_size
+        self.decoder = json.JSONDecoder()
+        self.buf = ""
+        self.pos = 0
+        self.eof = False
+
+    def _fill(self, size):
+        # Drop the consumed part of the window and append at least `size` chars
+        data = self.fp.read(max(size, self.chunk_size))
+        if not data:
+            self.eof = True
+        self.buf = self.buf[self.pos:] + data
+        self.pos = 0
+
+    def _error(self, msg):
+        return json.JSONDecodeError(msg, self.buf, self.pos)
+
+    def peek(self):
+        """ Return the next non-whitespace character, '' at the end of input.
+        """
+        while True:
+            self.pos = _whitespace.match(self.buf, self.pos).end()
+            if self.pos < len(self.buf) or self.eof:
+                break
+            self._fill(self.chunk_size)
+        return self.buf[self.pos:self.pos + 1]
+
+    def expect(self, char):
+        if self.peek() != char:
+            raise self._error("Expecting '{}'".format(char))
+        self.pos += 1
+
+    def value(self):
+        """ Decode and return the complete json value at the current position.
+        """
+        self.peek()
+        while True:
+            try:
+                obj, end = self.decoder.raw_decode(self.buf, self.pos)
+            except json.JSONDecodeError:
+                if self.eof:
+                    raise
+                # Value extends past the window; doubling keeps re-decoding linear
+                self._fill(len(self.buf))
+                continue
+            # A number may continue past the window's end
+            if end == len(self.buf) and not self.eof:
+                self._fill(self.chunk_size)
+                continue
+            self.pos = end
+            return obj
+
+    def members(self):
+        """ Yield the keys of the object at the current position.
+
+        The caller must consume each key's value before asking for the next key.
+        """
+        self.expect('{')
+        if self.peek() == '}':
+            self.pos += 1
+            return
+        while True:
+            if self.peek() != '"':
+                raise self._error("Expecting property name enclosed in double quotes")
+            key = self.value()
+            self.expect(':')
+            yield key
+            if self.peek() == ',':
+                self.pos += 1
+            else:
+                self.expect('}')
+                return
+
+    def elements(self):
+        """ Yield the indices of the array at the current position.
+
+        The caller must consume each element before asking for the next index.
+        """
+        self.expect('[')
+        if self.peek() == ']':
+            self.pos += 1
+            return
+        index = 0
+        while True:
+            yield index
+            index += 1
+            if self.peek() == ',':
+                self.pos += 1
+            else:
+                self.expect(']')
+                return
+
+    def end(self):
+        if self.peek() != '':
+            raise self._error("Extra data")
+
+def load(fp, on_result, chunk_size=CHUNK_SIZE):
+    """ Read the sarif document from the text file `fp`, streaming its results.
+
+    Every entry of runs[run_index].results is passed to
+    on_result(run_index, result_index, result) and then dropped.  Returns the
+    document with each of these results arrays left empty.  Raises
+    json.JSONDecodeError for invalid input; `on_result` may already have been
+    called for the results before the error.
+    """
+    scanner = _Scanner(fp, chunk_size)
+    if scanner.peek() != '{':
+        # Not a sarif document; read it whole and let the caller complain
+        document = scanner.value()
+        scanner.end()
+        return document
+    document = {}
+    for key in scanner.members():
+        if key == 'runs' and scanner.peek() == '[':
+            document[key] = [_load_run(scanner, run_index, on_result)
+                             for run_index in scanner.elements()]
+        else:
+            document[key] = scanner.value()
+    scanner.end()
+    return document
+
+def _load_run(scanner, run_index, on_result):
+    if scanner.peek() != '{':
+        return scanner.value()
+    run = {}
+    for key in scanner.members():
+        if key == 'results' and scanner.peek() == '[':
+            run[key] = []
+            for result_index in scanner.elements():
+                on_result(run_index, result_index, scanner.value())
+        else:
+            run[key] = scanner.value()
+    return run
+
+def destructure(tgraph, start_node, fp, fill=None, chunk_size=CHUNK_SIZE):
+    """ Destructure the sarif document in `fp` into `tgraph`, one result at a time.
+
+    Equivalent to typegraph.destructure(tgraph, start_node, fill(json.load(fp)))
+    with `fill` (e.g. signature.fillsig) applied to every result separately and
+    then to the remaining document.
+    """
+    on_result, finish = _result_destructurer(tgraph, start_node, fill)
+    finish(load(fp, on_result, chunk_size))
+
+def destructure_document(tgraph, start_node, document, fill=None):
+    """ Destructure the loaded sarif `document` like destructure().
+
+    Each result is dropped from the document once it is destructured, so the
+    tree shrinks while the tables grow.  The node ids are the same as those
+    from destructure() on the document's text.
+    """
+    on_result, finish = _result_destructurer(tgraph, start_node, fill)
+    runs = document.get('runs') if type(document) is dict else None
+    for run_index, run in enumerate(runs if type(runs) is list else []):
+        if type(run) is dict and type(run.get('results')) is list:
+            results, run['results'] = run['results'], []
+            for result_index in range(len(results)):
+                result, results[result_index] = results[result_index], None
+                on_result(run_index, result_index, result)
+            del results
+    finish(document)
+
+def _result_destructurer(tgraph, start_node, fill):
+    """ The pair of functions (on_result, finish) destructuring the results of a
+    document one at a time and then the document with emptied results arrays.
+    """
+    if fill is None:
+        fill = lambda tree: tree
+    results_node = _results_typedef(tgraph, start_node)
+    results_ids = {}
+
+    def on_result(run_index, result_index, result):
+        if run_index not in results_ids:
+            results_ids[run_index] = tgraph.new_id()
+        typegraph.destructure_entry(tgraph, results_node, results_ids[run_index],
+                                    result_index, fill(result))
+
+    def finish(document):
+        document = fill(document)
+        # Link the (now empty) results arrays to the entries destructured above
+        for run_index, results_id in results_ids.items():
+            tgraph.reserve_id(document['runs'][run_index]['results'], results_id)
+        typegraph.destructure(tgraph, start_node, document)
+
+    return on_result, finish
+
+def destructure_file(tgraph, start_node, fname, fill=None):
+    """ Destructure the sarif file `fname` (- for stdin) into `tgraph`.
+
+    Documents of STREAM_SIZE bytes and more are streamed with destructure(),
+    smaller ones are loaded whole with the fast json backend and passed to
+    destructure_document().  The size is that of the decompressed content for
+    compressed files.
+    """
+    with loader.open_input(fname, 'rb') as fp:
+        head = _read_head(fp)
+        if len(head) < STREAM_SIZE:
+            document = loader.loads(head)
+            del head
+            destructure_document(tgraph, start_node, document, fill)
+        else:
+            text = io.TextIOWrapper(io.BufferedReader(_Rejoined(head, fp)),
+                                    encoding='utf-8')
+            del head
+            destructure(tgraph, start_node, text, fill)
+
+def _read_head(fp):
+    # Up to STREAM_SIZE bytes of `fp`, read in CHUNK_SIZE pieces so that a
+    # small file does not cost a STREAM_SIZE buffer
+    chunks = []
+    size = 0
+    while size < STREAM_SIZE:
+        chunk = fp.read(min(CHUNK_SIZE, STREAM_SIZE - size))
+        if not chunk:
+            break
+        chunks.append(chunk)
+        size += len(chunk)
+    return b"".join(chunks)
+
+class _Rejoined(io.RawIOBase):
+    """ The bytes `head` followed by the rest of the file `fp`.
+    """
+    def __init__(self, head, fp):
+        self.head = memoryview(head)
+        self.fp = fp
+
+    def readable(self):
+        return True
+
+    def readinto(self, buf):
+        if self.head is not None:
+            size = min(len(buf), len(self.head))
+            buf[:size] = self.head[:size]
+            self.head = self.head[size:] if size < len(self.head) else None
+            return size
+        data = self.fp.read(len(buf))
+        buf[:len(data)] = data
+        return len(data)
+
+def _results_typedef(tgraph, start_node):
+    """ The typedef of runs[*].results in the type graph starting at `start_node`.
+    """
+    def field_type(node, fieldname):
+        subtype, *signature = tgraph.signature_graph[node]
+        return dict(signature)[fieldname]
+    subtype, *run_types = tgraph.signature_graph[field_type(start_node, 'runs')]
+    for index, run_node in run_types:
+        if 'results' in tgraph.fields[run_node]:
+            return field_type(run_node, 'results')
+    raise typegraph.SignatureMismatch()
@@ -22,10 +22,10 @@ class ScanTablesTypes:
         "id"                   : pd.UInt64Dtype(),
         "commit_id"            : pd.StringDtype(),
         "project_id"           : pd.UInt64Dtype(),
-        "db_create_start"      : numpy.dtype('M'),
-        "db_create_stop"       : numpy.dtype('M'),
-        "scan_start_date"      : numpy.dtype('M'),
-        "scan_stop_date"       : numpy.dtype('M'),
+        "db_create_start"      : numpy.dtype('datetime64[ns]'),
+        "db_create_stop"       : numpy.dtype('datetime64[ns]'),
+        "scan_start_date"      : numpy.dtype('datetime64[ns]'),
+        "scan_stop_date"       : numpy.dtype('datetime64[ns]'),
         "tool_name"            : pd.StringDtype(),
         "tool_version"         : pd.StringDtype(),
         "tool_query_commit_id" : pd.StringDtype(),
@@ -67,7 +67,7 @@ class ScanTablesTypes:
     projects = {
         "id"                 : pd.UInt64Dtype(),
         "project_name"       : pd.StringDtype(),
-        "creation_date"      : numpy.dtype('M'),
+        "creation_date"      : numpy.dtype('datetime64[ns]'),
         "repo_url"           : pd.StringDtype(),
         "primary_language"   : pd.StringDtype(),
         "languages_analyzed" : pd.StringDtype(),
@@ -187,8 +187,9 @@ def joins_for_results(basetables, external_info):
     #
     # Concatenation with an empty table triggers type conversion to float, so don't
     # include empty tables.
-    tables = [_results_from_kind_problem(basetables, external_info),
-              _results_from_kind_pathproblem(basetables, external_info)]
+    rules = _rule_index(basetables)
+    tables = [_results_from_kind_problem(basetables, external_info, rules),
+              _results_from_kind_pathproblem(basetables, external_info, rules)]
     stack = [table for table in tables if len(table) > 0]
     
     # Concatenation fails without at least one table, so avoid that.
@@ -205,40 +206,18 @@ def joins_for_results(basetables, external_info):
     res1 = normalize_dataframe_types(res, ScanTablesTypes.results)    
     return res1
 
-def _lookup_rule_value(basetable, rule_id, column_name, join_tags=False):
+def _rule_index(basetable):
     """
-    Look up a value in basetable.rules by id == rule_id.
-    If join_tags=True, concatenate all tag_text values with '_'.
+    Index the rule values used in the results table by rule id: the first
+    precision and problem.severity of each rule, and all its tag_text values
+    concatenated with '_'.
     """
-    df = basetable.rules
-
-    # Defensive check: avoid duplicate 'id' rows or missing entries
-    match = df.loc[df["id"] == rule_id, column_name]
-
-    if match.empty:
-        return None
-
-    if join_tags:
-        return match.str.cat(sep="_")
-
-    # For scalar columns, pick first entry safely
-    return match.head(1).item()
-
-# id as primary key
-def _populate_from_rule_table_code_flow_tag_text(basetable, flowtable):
-    return _lookup_rule_value(basetable, flowtable.rule_id.values[0], "tag_text", join_tags=True)
-
-# id as primary key
-def _populate_from_rule_table_tag_text(basetable, i):
-    return _lookup_rule_value(basetable, basetable.kind_problem.rule_id[i], "tag_text", join_tags=True)
-
-# id as primary key
-def _populate_from_rule_table(column_name, basetable, i):
-    return _lookup_rule_value(basetable, basetable.kind_problem.rule_id[i], column_name)
-
-# id as primary key
-def _populate_from_rule_table_code_flow(column_name, basetable, flowtable):
-    return _lookup_rule_value(basetable, flowtable.rule_id.values[0], column_name)
+    rules = basetable.rules
+    index = rules.drop_duplicates("id").set_index("id")[["precision", "problem.severity"]]
+    # tag_text may be all NaN (a float column) when no rule has tags
+    index = index.assign(tag_text=rules.groupby("id", sort=False)["tag_text"]
+                         .agg(lambda tags: tags.dropna().astype(str).str.cat(sep="_")))
+    return index
 
 
 # #id as primary key
@@ -263,19 +242,19 @@ def _populate_from_rule_table_code_flow(column_name, basetable, flowtable):
 #     # return basetable.rules.query("id == @val")[column_name].head(1).item()
 #     return basetable.rules.loc[basetable.rules["id"] == val, column_name].head(1).item()
 
-def _results_from_kind_problem(basetables, external_info):
+def _results_from_kind_problem(basetables, external_info, rules):
     b = basetables; e = external_info
-    flakegen = snowflake_id.Snowflake(2)
+    flakegen = snowflake_id.generator()
     res = pd.DataFrame(
         data={
-            'id': [flakegen.next() for _ in range(len(b.kind_problem))],
+            'id': flakegen.take(len(b.kind_problem)),
             
             'scan_id' : e.scan_id,
             'query_id' : b.kind_problem.rule_id,
             'query_kind'       :  "problem",
-            'query_precision'  :  [_populate_from_rule_table("precision", b, i) for i in range(len(b.kind_problem))],
-            'query_severity'   :  [_populate_from_rule_table("problem.severity", b, i) for i in range(len(b.kind_problem))],
-            'query_tags'   : [_populate_from_rule_table_tag_text(b, i) for i in range(len(b.kind_problem))],
+            'query_precision'  :  b.kind_problem.rule_id.map(rules["precision"]),
+            'query_severity'   :  b.kind_problem.rule_id.map(rules["problem.severity"]),
+            'query_tags'   : b.kind_problem.rule_id.map(rules["tag_text"]),
             'codeFlow_id' : 0,      # link to codeflows (kind_pathproblem only, NULL here)
             
             'message': b.kind_problem.message_text,
@@ -303,13 +282,13 @@ def _results_from_kind_problem(basetables, external_info):
     return res1
 
 
-def _results_from_kind_pathproblem(basetables, external_info):
+def _results_from_kind_pathproblem(basetables, external_info, rules):
     # 
     # Only get source and sink, no paths.  This implies one codeflow_index and one
     # threadflow_index, no repetitions.  
     # 
     b = basetables; e = external_info
-    flakegen = snowflake_id.Snowflake(3)
+    flakegen = snowflake_id.generator()
 
     # The sarif tables have relatedLocation information, which result in multiple
     # results for a single codeFlows_id -- the expression
@@ -334,65 +313,70 @@ def _results_from_kind_pathproblem(basetables, external_info):
             'relatedLocation_uriBaseId',
         ])
 
-    # Per codeflow_id taken from b.kind_pathproblem table, it should suffice to
-    # take one codeflow_index, one threadflow_index, first and last location_index
-    # from the b.codeflows table.
-    # 
-    # To ensure nothing is missed, collect all the entries and then check for
-    # unique rows.
-    cfids = reduced_kind_pathp['codeFlows_id'].unique()
-
-    source_sink_coll = []
-    for cfid0 in cfids:
-        cfid0t0 = b.codeflows[b.codeflows['codeflow_id'] == cfid0]
-        cfid0ppt0 = reduced_kind_pathp[reduced_kind_pathp['codeFlows_id'] ==
-                                       cfid0].drop_duplicates()
-        assert cfid0ppt0.shape[0] == 1, \
-            "Reduced kind_pathproblem table still has multiple entries"
-        for cfi0 in range(0, cfid0t0['codeflow_index'].max()+1):
-            cf0 = cfid0t0[cfid0t0['codeflow_index'] == cfi0]
-            for tfi0 in range(0, cf0['threadflow_index'].max()+1):
-                tf0 = cf0[ cf0['threadflow_index'] == tfi0 ]
-                loc_first = tf0['location_index'].min()
-                loc_last = tf0['location_index'].max()
-                source = tf0[tf0['location_index'] == loc_first]
-                sink = tf0[tf0['location_index'] == loc_last]
-                # Note that we're adding the unique row ids after the full table
-                # is done, below.
-                res = {
-                    'scan_id' : e.scan_id,
-                    'query_id' : cfid0ppt0.rule_id.values[0],
-                    'query_kind'       : "path-problem",
-                    'query_precision'  : _populate_from_rule_table_code_flow("precision", b, cfid0ppt0),
-                    'query_severity'   : _populate_from_rule_table_code_flow("problem.severity", b, cfid0ppt0),
-                    'query_tags'   : _populate_from_rule_table_code_flow_tag_text(b, cfid0ppt0),
-                    'codeFlow_id' : cfid0,
-                    # 
-                    'message': cfid0ppt0.message_text.values[0],
-                    'message_object' : pd.NA,
-                    'location': cfid0ppt0.location_uri.values[0],
-                    # 
-                    'source_location' : source.uri.values[0],
-                    'source_startLine' : source.startLine.values[0],
-                    'source_startCol' : source.startColumn.values[0],
-                    'source_endLine' : source.endLine.values[0],
-                    'source_endCol' : source.endColumn.values[0],
-                    # 
-                    'sink_location' : sink.uri.values[0],
-                    'sink_startLine' : sink.startLine.values[0],
-                    'sink_startCol' : sink.startColumn.values[0],
-                    'sink_endLine' : sink.endLine.values[0],
-                    'sink_endCol' : sink.endColumn.values[0],
-                    #
-                    'source_object' : pd.NA, # TODO: find high-level info from
-                                             # query name or tags?
-                    'sink_object' : pd.NA,
-                }
-                source_sink_coll.append(res)
-    results0 = pd.DataFrame(data=source_sink_coll).drop_duplicates().reset_index(drop=True)
+    # One row per codeFlows_id, in order of first appearance
+    paths = reduced_kind_pathp.drop_duplicates()
+    assert not paths['codeFlows_id'].duplicated().any(), \
+        "Reduced kind_pathproblem table still has multiple entries"
+    paths = paths.assign(path_order=range(len(paths)))
+
+    # Per codeflow_id taken from b.kind_pathproblem table, take the first and
+    # last location_index of every (codeflow_index, threadflow_index) from the
+    # b.codeflows table; idxmin/idxmax pick the first row of several with the
+    # same location_index.
+    flows = b.codeflows[b.codeflows['codeflow_id'].isin(paths['codeFlows_id'])] \
+        .reset_index(drop=True)
+    location_index = flows.groupby(
+        ['codeflow_id', 'codeflow_index', 'threadflow_index'])['location_index']
+    source = flows.loc[location_index.idxmin().values].reset_index(drop=True)
+    sink = flows.loc[location_index.idxmax().values].reset_index(drop=True)
+
+    # Order by codeFlows_id as in b.kind_pathproblem, then by codeflow_index
+    # and threadflow_index
+    path = source[['codeflow_id']].merge(
+        paths, how="left", left_on='codeflow_id', right_on='codeFlows_id',
+        validate="m:1")
+    order = path.sort_values('path_order', kind='stable').index
+    path, source, sink = (table.loc[order].reset_index(drop=True)
+                          for table in (path, source, sink))
+
+    if len(path) == 0:
+        results0 = pd.DataFrame(data=[])
+    else:
+        # Note that we're adding the unique row ids after the full table
+        # is done, below.
+        results0 = pd.DataFrame(
+            data={
+                'scan_id' : e.scan_id,
+                'query_id' : path.rule_id,
+                'query_kind'       : "path-problem",
+                'query_precision'  : path.rule_id.map(rules["precision"]),
+                'query_severity'   : path.rule_id.map(rules["problem.severity"]),
+                'query_tags'   : path.rule_id.map(rules["tag_text"]),
+                'codeFlow_id' : path.codeFlows_id,
+                # 
+                'message': path.message_text,
+                'message_object' : pd.NA,
+                'location': path.location_uri,
+                # 
+                'source_location' : source.uri,
+                'source_startLine' : source.startLine,
+                'source_startCol' : source.startColumn,
+                'source_endLine' : source.endLine,
+                'source_endCol' : source.endColumn,
+                # 
+                'sink_location' : sink.uri,
+                'sink_startLine' : sink.startLine,
+                'sink_startCol' : sink.startColumn,
+                'sink_endLine' : sink.endLine,
+                'sink_endCol' : sink.endColumn,
+                #
+                'source_object' : pd.NA, # TODO: find high-level info from
+                                         # query name or tags?
+                'sink_object' : pd.NA,
+            }).drop_duplicates().reset_index(drop=True)
 
     # Add the snowflake ids
-    results0['id'] = [flakegen.next() for _ in range(len(results0))]
+    results0['id'] = flakegen.take(len(results0))
 
     # The 'scan_id' column is needed for astype
     if len(results0) == 0:
@@ -0,0 +1,43 @@
+"""Split one list of sarif files across several runner processes or hosts.
+
+Two schemes are supported:
+
+- static shards: `--shard i/N` keeps the paths whose hash falls in shard i of
+  N.  The hash is of the path string as listed, so every host must use the
+  same sarif-files list.
+
+- a claim directory on a shared filesystem: a runner processes a path only if
+  it creates the path's claim file first.  Creation uses O_CREAT|O_EXCL, so
+  exactly one runner wins.  Claims are kept after the run; delete them to
+  process a path again.
+"""
+import os
+import socket
+from sarif_cli import hash
+
+def parse_shard(spec):
+    """ Parse 'i/N' into (i, N), with 1 <= i <= N.
+    """
+    try:
+        i, n = (int(part) for part in spec.split('/'))
+    except ValueError:
+        raise ValueError("shard must have the form i/N, got '{}'".format(spec))
+    if not 1 <= i <= n:
+        raise ValueError("shard i/N needs 1 <= i <= N, got '{}'".format(spec))
+    return i, n
+
+def in_shard(path, i, n):
+    return hash.hash_unique(path.encode()) % n == i - 1
+
+def claim(claim_dir, path):
+    """ Claim `path` for this process; return False if another process has it.
+    """
+    claim_file = os.path.join(claim_dir, "{:016x}.claim".format(
+        hash.hash_unique(path.encode())))
+    try:
+        fd = os.open(claim_file, os.O_CREAT | os.O_EXCL | os.O_WRONLY, 0o644)
+    except FileExistsError:
+        return False
+    with os.fdopen(fd, 'w') as fp:
+        fp.write("{} {} {}\n".format(socket.gethostname(), os.getpid(), path))
+    return True
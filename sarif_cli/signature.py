@@ -3,6 +3,7 @@
 These functions convert a SARIF (or any json structure) to its signature, with various options.  
 See sarif-to-dot for options and examples.
 """
+from copy import deepcopy
 from dataclasses import dataclass
 from . import traverse
 import zlib
@@ -44,9 +45,12 @@ def shorthash(signature):
 def _signature_dict(args, elem, context: Context):
     """ Assemble and return the signature for a dictionary.
     """
-    # Collect signatures
+    # Collect signatures.  fillsig() no longer sorts the keys, so filled trees
+    # are visited in sorted key order to keep the typedef listing order.
     sig = {}
-    for key, val in elem.items():
+    items = sorted(elem.items()) if getattr(args, 'fill_structure', False) \
+        else elem.items()
+    for key, val in items:
         sig[key] = _signature(args, val, context)
     # Sort signature
     keys = list(elem.keys())
@@ -181,7 +185,7 @@ def write_edges(args, fp, typedef, sig):
 #
 # Fill missing elements
 #
-region_keys = set([first for first, _ in  [ ('endColumn', 'Int'),
+region_keys = frozenset([first for first, _ in  [ ('endColumn', 'Int'),
                                             ('endLine', 'Int'),
                                             ('startColumn', 'Int'),
                                             ('startLine', 'Int')]])
@@ -196,11 +200,11 @@ def dummy_region():
         'startLine' : -1
     }
 
-physicalLocation_keys = set([first for first, _ in
+physicalLocation_keys = frozenset([first for first, _ in
                              [ ('artifactLocation', 'Struct000'), 
                                ('region', 'Struct005')]])
 
-properties_keys = set([first for first, _ in
+properties_keys = frozenset([first for first, _ in
                        [ ('description', 'String'),
                          ('kind', 'String'),
                          ('precision', 'String'),
@@ -221,7 +225,7 @@ dummy_properties = { 'description' : 'scli-dyys dummy value',
                      'tags' : ['scli-dyys dummy value'],
                     }
 
-relatedLocations_keys = set([first for first, _ in
+relatedLocations_keys = frozenset([first for first, _ in
                              [('message', 'Struct009'),
                               ('physicalLocation', 'Struct006'),
                               ('id', 'Int'),
@@ -244,126 +248,134 @@ dummy_message_entry = {'text': 'scli-dyys dummy value'}
 
 dummy_sourceLanguage = 'unknown'
 
-def fillsig_dict(args, elem, context):
-    """ Fill in the missing fields in dictionary signatures.
+# 
+# Key sets that trigger a fill rule, checked against each dict's keys
+# 
+results_rule_keys = frozenset(['locations', 'message', 'partialFingerprints',
+                               'ruleId', 'ruleIndex'])
+artifacts_rule_keys = frozenset(['columnKind', 'properties', 'tool',
+                                 'versionControlProvenance'])
+location_rule_keys = frozenset(['message', 'physicalLocation'])
+
+# Dicts without any of these keys need no filling
+fill_trigger_keys = (frozenset(['results', 'partialFingerprints', 'versionControlProvenance',
+                                'physicalLocation', 'defaultConfiguration', 'level',
+                                'semmle.formatSpecifier', 'primaryLocationLineHash'])
+                     | region_keys | physicalLocation_keys | properties_keys)
+
+scalar_types = frozenset([str, int, bool, float])
+
+def fillsig_dict(elem):
+    """ Fill in the missing fields of the dictionary `elem`, in place.
+
+    Several rules overlap and need to be applied together, so this is a simple
+    sequence of tests against the original keys.  Inserted defaults are fresh
+    copies, so the dummy values above are never shared or modified.
     """
-    full_elem = {}
-        
-    # Several rules overlap and need to be applied together, so this is (now) a
-    # simple sequence tests.
+    keys = frozenset(elem.keys())
 
-    if 'results' in elem.keys() and not 'automationDetails' in elem.keys():
+    if 'results' in keys and not 'automationDetails' in keys:
         # Want this to be flagged if not present- ie no submodule info added/no
         # sarif-category used  
-        full_elem['automationDetails'] = {'id' : "no-value-for-ad"}
+        elem['automationDetails'] = {'id' : "no-value-for-ad"}
 
-    if {'locations', 'message', 'partialFingerprints', 'ruleId',
-        'ruleIndex'}.issubset(elem.keys()):
+    if results_rule_keys <= keys:
         # Ensure 'rule' is present 
-        rule = elem.get('rule', None)
-        if rule is not None:
-            full_elem['rule'] = rule
-        else:
-            full_elem['rule'] = {
+        if elem.get('rule', None) is None:
+            elem['rule'] = {
                 "id" : elem.get('ruleId'),
                 "index" : elem.get('ruleIndex'),
             }
 
-    if {'columnKind', 'properties', 'tool',
-        'versionControlProvenance'}.issubset(elem.keys()):
-        full_elem['artifacts'] = elem.get('artifacts', [])
+    if artifacts_rule_keys <= keys:
+        elem.setdefault('artifacts', [])
 
-    if region_keys.intersection(elem.keys()):
+    if not region_keys.isdisjoint(keys):
         startLine, startColumn, endLine, endColumn = traverse.lineinfo(elem)
-        full_elem['endColumn'] = endColumn
-        full_elem['endLine'] = endLine
-        full_elem['startColumn'] = startColumn
-        full_elem['startLine'] = startLine
+        elem['endColumn'] = endColumn
+        elem['endLine'] = endLine
+        elem['startColumn'] = startColumn
+        elem['startLine'] = startLine
 
-    if physicalLocation_keys.intersection(elem.keys()):
-        full_elem['region'] = elem.get('region', dummy_region())
+    if not physicalLocation_keys.isdisjoint(keys):
+        if 'region' not in keys:
+            elem['region'] = dummy_region()
 
-    if properties_keys.intersection(elem.keys()):
+    if not properties_keys.isdisjoint(keys):
         for k, dummy_val in dummy_properties.items():
-            full_elem[k] = elem.get(k, dummy_val)
+            if k not in keys:
+                elem[k] = deepcopy(dummy_val)
 
-    if {'message', 'physicalLocation'}.issubset(elem.keys()):
+    if location_rule_keys <= keys:
          # Ensure an id is present when message/physicalLocation are
-        full_elem['id'] = elem.get('id', -1)
+        elem.setdefault('id', -1)
 
     if elem.get('defaultConfiguration') == {}:
-        full_elem['defaultConfiguration'] = {
+        elem['defaultConfiguration'] = {
             "enabled" : False,
             "level" : 'scli-dyys dummy value'
         }
 
-    if 'level' in elem.keys():
-        full_elem['enabled'] = elem.get('enabled', True)
+    if 'level' in keys:
+        elem.setdefault('enabled', True)
 
-    if 'semmle.formatSpecifier' in elem.keys():
+    if 'semmle.formatSpecifier' in keys:
         # Ensure semmle.sourceLanguage is present at least in dummy form
-        full_elem['semmle.sourceLanguage'] = elem.get('semmle.sourceLanguage', dummy_sourceLanguage)
+        elem.setdefault('semmle.sourceLanguage', dummy_sourceLanguage)
 
-    if 'versionControlProvenance' in elem.keys():
+    if 'versionControlProvenance' in keys:
         # Ensure newlineSequences is present when versionControlProvenance is
-        full_elem['newlineSequences'] = elem.get('newlineSequences', dummy_newlineSequences)
+        if 'newlineSequences' not in keys:
+            elem['newlineSequences'] = list(dummy_newlineSequences)
 
-    if 'primaryLocationLineHash' in elem.keys():
+    if 'primaryLocationLineHash' in keys:
         # Ensure primaryLocationStartColumnFingerprint is present
-        full_elem['primaryLocationStartColumnFingerprint'] = elem.get('primaryLocationStartColumnFingerprint', "fingerprint_placeholder")
-        
+        elem.setdefault('primaryLocationStartColumnFingerprint', "fingerprint_placeholder")
 
     #this fix depends on optional property defaultConfiguration being presents
-    if 'defaultConfiguration' in elem.keys():
+    if 'defaultConfiguration' in keys:
         # Ensure fullDescription is present
         # value must be unique because it is used in id gen used in table join later (joins_for_rules)
-        flake = flakegen.next()
-        full_elem['fullDescription'] = elem.get('fullDescription', "description_placeholder"+str(flake))   
+        if 'fullDescription' not in keys:
+            elem['fullDescription'] = "description_placeholder" + str(flakegen.next())
 
-    if 'partialFingerprints' in elem.keys():
+    if 'partialFingerprints' in keys:
         # Ensure relatedLocations is present
-        full_elem['relatedLocations'] = elem.get('relatedLocations',
-                                                 dummy_relatedLocations_entry)
+        if 'relatedLocations' not in keys:
+            elem['relatedLocations'] = deepcopy(dummy_relatedLocations_entry)
         
-    if 'physicalLocation' in elem.keys():
+    if 'physicalLocation' in keys:
         # Ensure id and message are present
-        full_elem['id'] = elem.get('id', -1)
-        full_elem['message'] = elem.get('message', dummy_message_entry)
-
-    # Supplement final keys with keys from input.  This is to ensure that keys
-    # not explicit here (like additions to the sarif standard) are propagated. 
-    remaining_keys = set(elem.keys()) - set(full_elem.keys())
-    for key in remaining_keys:
-        full_elem[key] = elem[key]
-
-    # Sort signature for consistency across inputs.
-    final = {}
-    keys = sorted(full_elem.keys())
-    for key in keys:
-        val = full_elem[key]
-        # And recurse to get nested elements
-        final[key] = fillsig(args, val, context)
-    return final
-
-def fillsig_list(args, elem, context):
-    """ 
-    """
-    # Collect all entries
-    final = []
-    for el in elem:
-        final.append(fillsig(args, el, context))
-    return final
+        elem.setdefault('id', -1)
+        if 'message' not in keys:
+            elem['message'] = dict(dummy_message_entry)
 
 def fillsig(args, elem, context):
-    """ Assemble and return the signature for a list/dict/value structure.
-    """
-    t = type(elem)
-    if t == dict:
-        return fillsig_dict(args, elem, context)
-    elif t == list:
-        return fillsig_list(args, elem, context)
-    elif t in [str, int, bool, float]:
-        return elem
-    else:
-        raise Exception("Unknown element type", t, elem)
+    """ Fill in the missing fields of the list/dict/value structure `elem`.
 
+    The structure is changed in place and returned.  The traversal uses an
+    explicit stack, so arbitrarily deep trees (e.g. long codeFlows) cannot hit
+    the recursion limit, and only dicts with a key from fill_trigger_keys are
+    examined by the fill rules.
+    """
+    stack = [elem]
+    while stack:
+        node = stack.pop()
+        t = type(node)
+        if t == dict:
+            if not fill_trigger_keys.isdisjoint(node.keys()):
+                fillsig_dict(node)
+            children = node.values()
+        elif t == list:
+            children = node
+        elif t in scalar_types:
+            continue
+        else:
+            raise Exception("Unknown element type", t, node)
+        for child in children:
+            t = type(child)
+            if t == dict or t == list:
+                stack.append(child)
+            elif t not in scalar_types:
+                raise Exception("Unknown element type", t, child)
+    return elem
@@ -14,8 +14,34 @@ time is in milliseconds (ms) since unix epoch.
 References:
     - https://www.ietf.org/id/draft-peabody-dispatch-new-uuid-format-02.html#name-informative-references
 """
+import numpy as np
 import time
 
+# The process id of this process' generator(); set_process_id() changes it
+_process_id = 0
+_generator = None
+
+def set_process_id(process_id):
+    """ Use `process_id` for the ids of generator() in this process.
+
+    Processes running at the same time must use distinct process ids, or they
+    may hand out the same ids.
+    """
+    global _process_id, _generator
+    _process_id = process_id
+    _generator = None
+
+def generator():
+    """ The Snowflake shared by all id users in this process.
+
+    It is created on first use rather than at import, so a forked worker does
+    not continue the parent's copy.
+    """
+    global _generator
+    if _generator is None:
+        _generator = Snowflake(_process_id)
+    return _generator
+
 class Snowflake:
     ms_max = (1<<41) * 2
     process_id_max = 1<<8
@@ -27,12 +53,19 @@ class Snowflake:
         self._process_id = process_id
         self._counter = 0
         
+    def _next_window(self):
+        # The current millisecond, once the clock has left the used one.  Ids
+        # never run ahead of the clock, so a later generator with the same
+        # process id, e.g. in a replacement worker started after the old one
+        # was killed, cannot repeat them.
+        while ((time_ms := int(time.time_ns() / 1e6)) <= self._time_ms):
+            time.sleep(0.0002)
+        self._time_ms = time_ms
+        self._counter = 0
+
     def next(self):
         if self._counter >= Snowflake.counter_max:
-            while ((time_ms := int(time.time_ns() / 1e6)) <= self._time_ms):
-                pass            # TODO: profile this; should be few loops if any 
-            self._time_ms = time_ms
-            self._counter = 0
+            self._next_window()
 
         flake = (self._time_ms << (23) |
                  self._process_id << (15) |
@@ -41,6 +74,26 @@ class Snowflake:
 
         return flake
 
+    def take(self, n):
+        """ Return the next `n` ids as a uint64 array.
+
+        Like next(), take() waits for the next millisecond when the counter
+        runs out, so a block of n ids takes at least n / counter_max ms.
+        """
+        flakes = np.empty(n, dtype=np.uint64)
+        done = 0
+        while done < n:
+            if self._counter >= Snowflake.counter_max:
+                self._next_window()
+            count = min(n - done, Snowflake.counter_max - self._counter)
+            base = np.uint64(self._time_ms << (23) |
+                             self._process_id << (15))
+            flakes[done:done + count] = base + np.arange(
+                self._counter, self._counter + count, dtype=np.uint64)
+            self._counter += count
+            done += count
+        return flakes
+
 if __name__ == '__main__':
     # Test lower bits and counter wrapping
     fgen = Snowflake(0)
@@ -1,7 +1,7 @@
  # csv status reporting
 import csv
 
-STATUS_NUM = 6
+STATUS_NUM = 8
 
 fieldnames = ['sarif_file', 'level', 'levelcode', 'message', "extra_info"]
 
@@ -16,6 +16,8 @@ warning_set = {
 # Setup csv status writer
 #
 def setup_csv_writer(filename):
+  # start from clean counters; processes may handle several sarif files
+  reset_warnings()
   with open(filename+'.csv', 'w', newline='') as file:
     # global in module as singleton alt
       global global_filename
@@ -52,6 +54,13 @@ def csv_write_warnings():
       if warning_set["success"] != 0:
         csv_writer.writerow(success)
 
+def reset_warnings():
+  for key in warning_set:
+    warning_set[key] = 0
+  input_sarif_missing["extra_info"] = "Missing: "
+  input_sarif_extra["extra_info"] = "Extra properties: "
+  setup_status_filenames("")
+
 def setup_status_filenames(sarif_file_name):
   success["sarif_file"] = sarif_file_name
   zero_results["sarif_file"] = sarif_file_name
@@ -59,6 +68,8 @@ def setup_status_filenames(sarif_file_name):
   input_sarif_missing["sarif_file"] = sarif_file_name
   unknown_sarif_parsing_shape["sarif_file"] = sarif_file_name
   unknown["sarif_file"] = sarif_file_name
+  timeout["sarif_file"] = sarif_file_name
+  memory_limit["sarif_file"] = sarif_file_name
 
 success = {
   "sarif_file": "",
@@ -111,4 +122,18 @@ unknown = {
   "level": "ERROR",
   "levelcode": 6,
   "message": "Error details currently undiagnosed. Assess log file for more information."
-}
\ No newline at end of file
+}
+
+timeout = {
+  "sarif_file": "",
+  "level": "ERROR",
+  "levelcode": 7,
+  "message": "Processing stopped at the per-file time limit."
+}
+
+memory_limit = {
+  "sarif_file": "",
+  "level": "ERROR",
+  "levelcode": 8,
+  "message": "Processing stopped at the per-file memory limit."
+}
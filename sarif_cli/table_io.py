@@ -0,0 +1,339 @@
+"""Reading and writing the scan tables in csv, parquet or arrow format.
+
+sarif-extract-scans writes one file per table into a .scantables directory,
+named after the table with the format's suffix; sarif-aggregate-scans and
+sarif-pad-aggregate read them back, whatever the format.
+
+A table may also be a dataset: a directory named after the table holding any
+number of part files of one format, e.g. results/part-00003.parquet, as
+written by `sarif-aggregate-scans --incremental`, possibly in hive-style
+partition directories like scans/project_id=1234/.  The parts are read in
+file name order, directory by directory, and concatenated.  As hive readers
+(pyarrow.dataset, pd.read_parquet) expect, a partition key that is a column of
+the table is left out of the part files; reading puts it back from the
+directory names.  Other partition values are not added as columns.
+
+csv files use QUOTE_NONNUMERIC and are re-typed on reading from the dtypes in
+scan_tables.ScanTablesTypes and table_joins.BaseTablesTypes.  parquet and arrow
+(feather) files keep these dtypes with the data; both need the `pyarrow`
+module.
+"""
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from copy import deepcopy
+import argparse
+import collections
+import csv
+import importlib
+import numpy
+import os
+import pandas as pd
+import urllib.parse
+
+from sarif_cli import scan_tables
+from sarif_cli import table_joins
+
+FORMATS = ("csv", "parquet", "arrow")
+
+SUFFIXES = {"csv": ".csv", "parquet": ".parquet", "arrow": ".arrow"}
+
+# The format of datetime columns in csv files written by TableWriter.  pandas
+# picks a format per to_csv() call, date-only when every time is midnight,
+# which would differ between the frames of one table.
+CSV_DATE_FORMAT = "%Y-%m-%d %H:%M:%S"
+
+# The hive-style name of the partition of missing values
+DEFAULT_PARTITION = "__HIVE_DEFAULT_PARTITION__"
+
+# The tables of a .scantables directory and their dtypes
+TABLE_DTYPES = {
+    "scans" : scan_tables.ScanTablesTypes.scans,
+    "results" : scan_tables.ScanTablesTypes.results,
+    "projects" : scan_tables.ScanTablesTypes.projects,
+    "codeflows" : table_joins.BaseTablesTypes.codeflows,
+}
+
+def table_file(directory, name, fmt):
+    return os.path.join(directory, name + SUFFIXES[fmt])
+
+def find_table(directory, name):
+    """ Return (file name, format) of table `name` in `directory`, or None.
+
+    For a dataset the file name is that of its directory.  Writing a table
+    removes its files in the other formats; of those left by older versions,
+    the newest is used.
+    """
+    found = [(os.stat(fname).st_mtime_ns, fname, fmt)
+             for fmt in FORMATS
+             for fname in [table_file(directory, name, fmt)]
+             if os.path.exists(fname)]
+    if found:
+        _, fname, fmt = max(found)
+        return fname, fmt
+    dataset = os.path.join(directory, name)
+    if os.path.isdir(dataset):
+        fmt = _dataset_format(dataset)
+        if fmt is not None:
+            return dataset, fmt
+    return None
+
+def dataset_files(dataset, fmt=None):
+    """ The part files of the `dataset` directory and its partition
+    directories, in reading order; only those of format `fmt` if given.
+    """
+    suffixes = (SUFFIXES[fmt],) if fmt else tuple(SUFFIXES.values())
+    found = []
+    for dirpath, dirnames, fnames in os.walk(dataset):
+        dirnames.sort()
+        found.extend(os.path.join(dirpath, fname) for fname in sorted(fnames)
+                     if fname.endswith(suffixes))
+    return found
+
+def partition_values(dataset, fname):
+    """ The {key : value} of the partition directories between the `dataset`
+    directory and its part file `fname`; None for DEFAULT_PARTITION.
+    """
+    values = {}
+    relative = os.path.relpath(os.path.dirname(fname), dataset)
+    for segment in relative.split(os.sep):
+        key, sep, value = segment.partition("=")
+        if sep:
+            values[key] = (None if value == DEFAULT_PARTITION
+                           else urllib.parse.unquote(value))
+    return values
+
+def _with_partition_columns(frame, name, values):
+    # Put the partition keys that are columns of table `name` back into
+    # `frame`, at their place in the table's columns
+    dtypes = TABLE_DTYPES[name]
+    for key, value in values.items():
+        if key not in dtypes or key in frame.columns:
+            continue
+        column = pd.Series([value] * len(frame), index=frame.index,
+                           dtype=object).astype(dtypes[key])
+        position = len([col for col in list(dtypes)[:list(dtypes).index(key)]
+                        if col in frame.columns])
+        frame.insert(position, key, column)
+    return frame
+
+def _dataset_format(dataset):
+    for fname in dataset_files(dataset):
+        for fmt, suffix in SUFFIXES.items():
+            if fname.endswith(suffix):
+                return fmt
+    return None
+
+def csv_dtypes(name):
+    """ Return (dtypes, parse_dates) for reading table `name` from csv.
+
+    pandas cannot parse datetime64 via `dtype`, so those columns are read as
+    str and listed in parse_dates instead.
+    """
+    dtypes = deepcopy(TABLE_DTYPES[name])
+    parse_dates = []
+    for col_key, col_dtype in dtypes.items():
+        if col_dtype == numpy.dtype('datetime64[ns]'):
+            # Note: pd.StringDtype() here will cause parsing failure later
+            dtypes[col_key] = str
+            parse_dates.append(col_key)
+    return dtypes, parse_dates
+
+def read_table(directory, name):
+    """ Read table `name` from `directory` in whichever format it was written.
+    """
+    found = find_table(directory, name)
+    if found is None:
+        raise FileNotFoundError(table_file(directory, name, "csv"))
+    return read_table_file(*found, name)
+
+def read_table_file(fname, fmt, name):
+    if os.path.isdir(fname):
+        return pd.concat([_with_partition_columns(read_table_file(part, fmt, name),
+                                                  name, partition_values(fname, part))
+                          for part in dataset_files(fname, fmt)],
+                         ignore_index=True)
+    if fmt == "csv":
+        dtypes, parse_dates = csv_dtypes(name)
+        return pd.read_csv(fname, dtype=dtypes, parse_dates=parse_dates)
+    elif fmt == "parquet":
+        return pd.read_parquet(fname)
+    else:
+        return pd.read_feather(fname)
+
+def read_tables(directory, names):
+    """ Read the tables `names` from `directory` into a {name : DataFrame}
+    dict, or return None if any of them is missing.
+    """
+    if not os.path.isdir(directory):
+        return None
+    found = {name : find_table(directory, name) for name in names}
+    if None in found.values():
+        return None
+    return {name : read_table_file(*found[name], name) for name in names}
+
+def map_in_order(fn, items, jobs=1, processes=False):
+    """ Yield fn(item) for each of `items`, in the order of `items`.
+
+    With jobs > 1, up to `jobs` calls run at the same time in a thread pool,
+    or a process pool if `processes` is set (`fn` and its arguments must then
+    be picklable).  Reading ahead is limited to 2 * jobs results, so a slow
+    consumer does not pile up tables in memory.
+    """
+    if jobs <= 1:
+        yield from map(fn, items)
+        return
+    pool_class = ProcessPoolExecutor if processes else ThreadPoolExecutor
+    with pool_class(max_workers=jobs) as pool:
+        pending = collections.deque()
+        for item in items:
+            pending.append(pool.submit(fn, item))
+            if len(pending) >= 2 * jobs:
+                yield pending.popleft().result()
+        while pending:
+            yield pending.popleft().result()
+
+def write_table(directory, name, frame, fmt="csv", columns=None):
+    """ Write `frame` as table `name` into `directory`, limited to `columns`
+    if given.
+
+    The table is written to a temporary file that then replaces the old one,
+    so readers never see a partial table and a hard-linked old file (e.g. an
+    entry of the result_cache) is left alone.  Files of the table in other
+    formats are removed, so that readers do not pick up stale tables.
+    """
+    fname = table_file(directory, name, fmt)
+    tmpname = fname + ".tmp"
+    if fmt == "csv":
+        with open(tmpname, 'wb') as fh:
+            frame.to_csv(fh, index=False, columns=columns,
+                         quoting=csv.QUOTE_NONNUMERIC)
+    else:
+        if columns is not None:
+            frame = frame[columns]
+        if fmt == "parquet":
+            frame.to_parquet(tmpname, index=False)
+        else:
+            frame.reset_index(drop=True).to_feather(tmpname)
+    os.replace(tmpname, fname)
+    _remove_other_formats(directory, name, fmt)
+
+def _remove_other_formats(directory, name, fmt):
+    for other in FORMATS:
+        if other != fmt and os.path.exists(table_file(directory, name, other)):
+            os.remove(table_file(directory, name, other))
+
+class TableWriter:
+    """ Write table `name` into `directory` one frame at a time.
+
+    Each append()ed frame is written out right away -- as more csv rows under
+    the one header, a parquet row group or arrow record batches -- so only the
+    current frame is held in memory.  The columns, and for parquet and arrow
+    the schema, come from the first frame.  Use as a context manager or call
+    close(); without any frames, close() writes an empty table.  As with
+    write_table(), the frames go to a temporary file that replaces the table
+    on close().
+    """
+    def __init__(self, directory, name, fmt="csv", columns=None):
+        self.directory = directory
+        self.fname = table_file(directory, name, fmt)
+        self.tmpname = self.fname + ".tmp"
+        self.name = name
+        self.fmt = fmt
+        self.columns = columns
+        self.schema = None
+        self.writer = None
+        self.fh = None
+
+    def append(self, frame):
+        if self.columns is None:
+            self.columns = list(frame.columns)
+        frame = frame[self.columns]
+        if self.fmt == "csv":
+            header = self.fh is None
+            if header:
+                self.fh = open(self.tmpname, 'w')
+            frame.to_csv(self.fh, index=False, header=header,
+                         quoting=csv.QUOTE_NONNUMERIC, date_format=CSV_DATE_FORMAT)
+            return
+        import pyarrow as pa
+        if self.schema is None:
+            self.schema = _schema(pa, frame)
+            if self.fmt == "parquet":
+                import pyarrow.parquet as pq
+                self.writer = pq.ParquetWriter(self.tmpname, self.schema)
+            else:
+                self.writer = pa.ipc.new_file(self.tmpname, self.schema)
+        table = pa.Table.from_pandas(frame, schema=self.schema, preserve_index=False)
+        self.writer.write_table(table)
+
+    def close(self):
+        if self.fh is None and self.writer is None and self.name in TABLE_DTYPES:
+            # No frames: write an empty table with the known columns
+            dtypes = TABLE_DTYPES[self.name]
+            self.append(pd.DataFrame(columns=list(dtypes)).astype(dtypes))
+        if self.fh is None and self.writer is None:
+            return
+        if self.fh is not None:
+            self.fh.close()
+        if self.writer is not None:
+            self.writer.close()
+        self.fh = self.writer = None
+        os.replace(self.tmpname, self.fname)
+        _remove_other_formats(self.directory, self.name, self.fmt)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+def _schema(pa, frame):
+    # Columns without any value in the first frame (e.g. message_object) have
+    # the null type, which later values could not be stored in
+    schema = pa.Schema.from_pandas(frame, preserve_index=False)
+    for i, field in enumerate(schema):
+        if field.type == pa.null():
+            schema = schema.set(i, field.with_type(pa.string()))
+    return schema
+
+def available():
+    """ The formats usable with the installed modules.
+    """
+    try:
+        importlib.import_module("pyarrow")
+    except ImportError:
+        return ["csv"]
+    return list(FORMATS)
+
+def _format_type(fmt):
+    if fmt not in FORMATS:
+        raise argparse.ArgumentTypeError(
+            "unknown output format '{}'; choose from {}"
+            .format(fmt, ", ".join(FORMATS)))
+    if fmt not in available():
+        raise argparse.ArgumentTypeError(
+            "output format '{}' needs the pyarrow module".format(fmt))
+    return fmt
+
+def add_format_argument(parser):
+    """ Add --output-format to `parser`.
+    """
+    parser.add_argument('--output-format', metavar='format', type=_format_type,
+                        default='csv',
+                        help='Format of the table files, one of {}.  '
+                        'Default: csv'.format(', '.join(FORMATS)))
+
+def _jobs_type(jobs):
+    jobs = int(jobs)
+    if jobs < 1:
+        raise argparse.ArgumentTypeError("the number of jobs must be at least 1")
+    return jobs
+
+def add_jobs_argument(parser):
+    """ Add -j/--jobs and --processes, the arguments of map_in_order(), to
+    `parser`.
+    """
+    parser.add_argument('-j', '--jobs', metavar='N', type=_jobs_type, default=1,
+                        help='Number of input files read at the same time.'
+                        '  Default: %(default)d')
+    parser.add_argument('--processes', action='store_true',
+                        help='Read with -j worker processes instead of threads')
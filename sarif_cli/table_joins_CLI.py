@@ -7,7 +7,7 @@
 """
 import pandas as pd
 import re
-from .typegraph import tagged_array_columns, tagged_struct_columns
+from .typegraph import derived_frame, tagged_array, tagged_struct
 
 class BaseTablesTypes:
     codeflows = {
@@ -27,13 +27,18 @@ class BaseTablesTypes:
 
 def joins_for_af_0350_location(tgraph):
     """ 
-    Join all the tables used by 0350's right side into one.
+    Join all the tables used by 0350's right side into one.  The result is
+    computed once per typegraph and shared, see typegraph.derived_frame().
     """
+    return derived_frame(tgraph, __name__ + '.af_0350_location',
+                         lambda: _joins_for_af_0350_location(tgraph))
+
+def _joins_for_af_0350_location(tgraph):
     # Access convenience functions
     sf = lambda num: tgraph.dataframes['Struct' + str(num)]
     af = lambda num: tgraph.dataframes['Array' + str(num)]
-    sft = lambda id: sf(id).rename(columns = tagged_struct_columns(tgraph, id))
-    aft = lambda id: af(id).rename(columns = tagged_array_columns(tgraph, id))
+    sft = lambda id: tagged_struct(tgraph, id)
+    aft = lambda id: tagged_array(tgraph, id)
     
     af_0350_location =  (
         aft('0350')
@@ -75,8 +80,13 @@ def joins_for_af_0350_location(tgraph):
 
 def joins_for_location_info(tgraph):
     """ 
-    Join all the tables used by 2683's right side into one.
+    Join all the tables used by 2683's right side into one.  The result is
+    computed once per typegraph and shared, see typegraph.derived_frame().
     """
+    return derived_frame(tgraph, __name__ + '.location_info',
+                         lambda: _joins_for_location_info(tgraph))
+
+def _joins_for_location_info(tgraph):
     # Access convenience functions
     sf = lambda num: tgraph.dataframes['Struct' + str(num)]
     # 
@@ -103,6 +113,18 @@ def joins_for_location_info(tgraph):
 
     return sf_2683
 
+def _af_0350_relatedLocation(tgraph, af_0350_location):
+    """ 
+    af_0350_location with the columns named for relatedLocations.  Only that of
+    the shared frame from joins_for_af_0350_location() is kept for later calls.
+    """
+    def rename():
+        return af_0350_location.rename(
+            columns=lambda x: re.sub('m0350_location', 'm0350_relatedLocation', x))
+    if tgraph.derived.get(__name__ + '.af_0350_location') is not af_0350_location:
+        return rename()
+    return derived_frame(tgraph, __name__ + '.af_0350_relatedLocation', rename)
+
 def joins_for_problem(tgraph, af_0350_location):
     """ 
     Return table providing the `problem` information.
@@ -110,8 +132,8 @@ def joins_for_problem(tgraph, af_0350_location):
     # Access convenience functions
     sf = lambda num: tgraph.dataframes['Struct' + str(num)]
     af = lambda num: tgraph.dataframes['Array' + str(num)]
-    sft = lambda id: sf(id).rename(columns = tagged_struct_columns(tgraph, id))
-    aft = lambda id: af(id).rename(columns = tagged_array_columns(tgraph, id))
+    sft = lambda id: tagged_struct(tgraph, id)
+    aft = lambda id: tagged_array(tgraph, id)
     # 
     # Form the message dataframe (@kind problem) via joins
     # 
@@ -128,9 +150,7 @@ def joins_for_problem(tgraph, af_0350_location):
                right_on='m0350_location_array_id', validate="1:m")
         .drop(columns=['t4055_locations', 'm0350_location_array_id'])
         #
-        .merge(af_0350_location.rename(columns=lambda x: re.sub('m0350_location',
-                                                                'm0350_relatedLocation',
-                                                                x)),
+        .merge(_af_0350_relatedLocation(tgraph, af_0350_location),
                how="left", left_on='t4055_relatedLocations',
                right_on='m0350_relatedLocation_array_id', validate="1:m")
         .drop(columns=['t4055_relatedLocations', 'm0350_relatedLocation_array_id'])
@@ -220,8 +240,8 @@ def joins_for_path_problem(tgraph, af_0350_location):
     # Access convenience functions
     sf = lambda num: tgraph.dataframes['Struct' + str(num)]
     af = lambda num: tgraph.dataframes['Array' + str(num)]
-    sft = lambda id: sf(id).rename(columns = tagged_struct_columns(tgraph, id))
-    aft = lambda id: af(id).rename(columns = tagged_array_columns(tgraph, id))
+    sft = lambda id: tagged_struct(tgraph, id)
+    aft = lambda id: tagged_array(tgraph, id)
 
     kind_pathproblem_1 = (
         aft(1768)
@@ -233,9 +253,7 @@ def joins_for_path_problem(tgraph, af_0350_location):
                right_on='m0350_location_array_id', validate="1:m")
         .drop(columns=['t9699_locations', 'm0350_location_array_id'])
         #
-        .merge(af_0350_location.rename(columns=lambda x: re.sub('m0350_location',
-                                                                'm0350_relatedLocation',
-                                                                x)),
+        .merge(_af_0350_relatedLocation(tgraph, af_0350_location),
                how="left", left_on='t9699_relatedLocations',
                right_on='m0350_relatedLocation_array_id', validate="1:m")
         .drop(columns=['t9699_relatedLocations', 'm0350_relatedLocation_array_id'])
@@ -384,9 +402,9 @@ def joins_for_rules(tgraph):
     """
     # Access convenience functions
     sf = lambda num: tgraph.dataframes['Struct' + str(num)]
-    sft = lambda id: sf(id).rename(columns = tagged_struct_columns(tgraph, id))
+    sft = lambda id: tagged_struct(tgraph, id)
     af = lambda num: tgraph.dataframes['Array' + str(num)]
-    aft = lambda id: af(id).rename(columns = tagged_array_columns(tgraph, id))
+    aft = lambda id: tagged_array(tgraph, id)
     # 
     rules_df = (
         aft('0147')
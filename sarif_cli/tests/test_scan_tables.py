@@ -0,0 +1,24 @@
+import types
+
+import numpy
+import pandas as pd
+
+from sarif_cli import scan_tables
+
+def _basetables(tag_text):
+    rules = pd.DataFrame({"id": ["js/a", "js/a", "js/b"],
+                          "precision": ["high", "high", "low"],
+                          "problem.severity": ["error", "error", "warning"],
+                          "tag_text": tag_text})
+    return types.SimpleNamespace(rules=rules)
+
+def test_rule_index_joins_tags():
+    index = scan_tables._rule_index(_basetables(["security", "external", None]))
+    assert index.loc["js/a", "tag_text"] == "security_external"
+    assert index.loc["js/b", "tag_text"] == ""
+    assert index.loc["js/b", "precision"] == "low"
+
+def test_rule_index_without_tags():
+    index = scan_tables._rule_index(_basetables([numpy.nan] * 3))
+    assert list(index["tag_text"]) == ["", ""]
+    assert list(index["problem.severity"]) == ["error", "warning"]
@@ -7,9 +7,12 @@ To get a map of this type graph, use
 This file also contains some type graph reference values; these may be moved out into
 separate files at some point.
 """
+from array import array
 from dataclasses import dataclass
 import logging
+import sys
 from typing import Any, Dict, List, Tuple, Union
+import numpy as np
 import pandas as pd
 from sarif_cli import status_writer
 
@@ -26,15 +29,66 @@ class SignatureMismatch(Exception):
 Tree = Union[Dict, List, int, str, bool]
 NodeId = str
 
+class Columns:
+    """ The rows of one typedef's table, stored by column.
+
+    `kinds` gives the kind of each column: 'id' columns are array('q'), 'str'
+    columns lists of interned strings and 'value' columns plain lists.
+    """
+    def __init__(self, kinds):
+        self.kinds = kinds
+        self.columns = [array('q') if kind == 'id' else [] for kind in kinds]
+
+    def append(self, row):
+        for column, kind, value in zip(self.columns, self.kinds, row):
+            column.append(_intern(value) if kind == 'str' else value)
+
+    def __len__(self):
+        return len(self.columns[0])
+
+    def truncate(self, length):
+        for column in self.columns:
+            del column[length:]
+
+    def dataframe(self, colheader):
+        if len(self) == 0:
+            return pd.DataFrame([], columns = colheader)
+        # Copy the id columns out of their buffers: a frombuffer view is
+        # read-only and would keep the array from growing.
+        return pd.DataFrame({header: np.frombuffer(column, dtype=np.int64).copy()
+                             if kind == 'id' else column
+                             for header, kind, column
+                             in zip(colheader, self.kinds, self.columns)},
+                            columns = colheader)
+
+def _intern(value):
+    return sys.intern(value) if type(value) is str else value
+
+def column_kinds(signature_graph, typedef):
+    """ The Columns kinds of the table for `typedef`.
+    """
+    subtype, *signature = signature_graph[typedef]
+    def kind(ftype):
+        return ('str' if ftype == 'String' else
+                'value' if ftype in _leaf_types else
+                'id')
+    if subtype == 'struct':
+        return ('id', *(kind(ftype) for fieldname, ftype in signature))
+    kinds = {kind(sigtype) for sigindex, sigtype in signature}
+    return ('id', 'id', 'str', kinds.pop() if len(kinds) == 1 else 'value')
+
 #
 # Data aggregate
 #
 @dataclass
 class Typegraph:
     signature_graph : Dict[NodeId, Any]   # (typedef -> signature) dict
-    instances : Dict[NodeId, List[Tuple]] # (node -> (row list)) dict
+    instances : Dict[NodeId, Columns]     # (node -> (row columns)) dict
     fields: Dict[NodeId, List]            # (node -> (field list)) dict
     dataframes: Dict[NodeId, Any]         # (node -> dataframe) dict
+    derived: Dict[str, Any]               # (name -> dataframe) dict, see derived_frame()
+    last_id: int                          # last subtree id handed out
+    reserved_ids: Dict[int, int]          # (id(subtree) -> subtree id) dict
 
     """
     # Given this typedef
@@ -44,7 +98,7 @@ class Typegraph:
             ('runs', 'Array0177'),
             ('version', 'String')))
     # and an instance SI of Struct6787, we have the following fields:
-    instances['Struct6787'] = []
+    instances['Struct6787'] = Columns(('id', 'str', 'id', 'str'))
 
     fields['Struct6787'] = ('$schema',        # Sorted from here
                             'runs',
@@ -56,16 +110,20 @@ class Typegraph:
                                   'version')
     
     # The values are filled via
-    instances['Struct6787'].append( (id(SI), # "uplink" id
+    instances['Struct6787'].append( (SI_id,          # "uplink" id
                                      SI['$schema'],  # value for int|string|bool
-                                     id(SI['runs']), # "downlink" id
+                                     runs_id,        # "downlink" id
                                      SI['version']) )
     # which may evaluate to, e.g., 
-    instances['Struct6787'].append( (4543584064,
+    instances['Struct6787'].append( (1,
                                      'schema-sarif...',
-                                     4543582656,
+                                     2,
                                      '2.1') )
 
+    # The ids are handed out by node_id() in traversal order.  Unlike id()
+    # they stay unique after a subtree is freed, so a streamed sarif file's
+    # results can be released as soon as they are destructured.
+
     # Array entries use a fixed header with labeled entries:
     # (array_id, value_index, value_type, id_or_value_at_index)
     
@@ -86,10 +144,33 @@ class Typegraph:
         self.instances = {}
         self.fields = {}
         self.dataframes = {}
+        self.derived = {}
+        self.last_id = 0
+        self.reserved_ids = {}
         for typedef, signature in signature_graph:
-            self.instances[typedef] = []
+            if typedef not in _leaf_types:
+                self.instances[typedef] = Columns(
+                    column_kinds(self.signature_graph, typedef))
             self.fields[typedef] = fields(signature)
-            
+        # Generated destructuring functions bound to this typegraph, see compile_graph()
+        (self.struct_bodies, self.dict_destructurers, self.list_destructurers,
+         self.entry_destructurers) = compile_graph(signature_graph)(self)
+
+    def new_id(self):
+        self.last_id += 1
+        return self.last_id
+
+    def reserve_id(self, subtree, subtree_id):
+        """ Use `subtree_id` as the id of `subtree` when it is destructured.
+
+        For streamed input, where the ids of a subtree's entries are needed
+        before the subtree itself is complete.
+        """
+        self.reserved_ids[id(subtree)] = subtree_id
+
+    def node_id(self, subtree):
+        return self.reserved_ids.pop(id(subtree), None) or self.new_id()
+
 def fields(signature):
     if type(signature) != tuple: 
         # 'bool', 'int', 'string'
@@ -104,12 +185,18 @@ def dict_fields(tree: Dict):
 #
 # Destructuring functions use the typegraph to destructure all subtrees into tables
 #
-def destructure(typegraph: Typegraph, node: NodeId, tree: Tree):
+def destructure(typegraph: Typegraph, node: NodeId, tree: Tree, tree_id=None):
+    if tree_id is None:
+        tree_id = typegraph.node_id(tree)
     t = type(tree)
-    if t == dict:
-        _destructure_dict(typegraph, node, tree)
+    if t == dict and node in typegraph.dict_destructurers:
+        typegraph.dict_destructurers[node](tree, tree_id)
+    elif t == dict:
+        _destructure_dict(typegraph, node, tree, tree_id)
+    elif t == list and node in typegraph.list_destructurers:
+        typegraph.list_destructurers[node](tree, tree_id)
     elif t == list:
-        _destructure_list(typegraph, node, tree)
+        _destructure_list(typegraph, node, tree, tree_id)
     elif t in [str, int, bool]:
         pass
     else:
@@ -117,50 +204,26 @@ def destructure(typegraph: Typegraph, node: NodeId, tree: Tree):
         status_writer.csv_write(status_writer.unknown_sarif_parsing_shape)
         raise Exception("Unhandled type: %s" % t)
 
-def _destructure_dict_1(typegraph, node, tree):
+def _destructure_dict_1(typegraph, node, tree, tree_id):
+    """ Destructure a dictionary holding (at least) the fields of `node`, via
+    the struct body generated by compile_graph().
     """
-    # typegraph.signature_graph destructuring
-    d1 = dict(struct_graph_2022_02_01)
-    In [765]: typ, *sig = d1['Struct6787']
-    
-    In [766]: sig
-    Out[766]: [('$schema', 'String'), ('runs', 'Array0177'), ('version', 'String')]
-    
-    In [767]: typ
-    Out[774]: 'struct'
-    """
-    def id_or_value(tree, fieldname, fieldtype):
-        """ Id for recursive types, value for leaves
-        """
-        if fieldtype in ['Bool', 'Int', 'String']:
-            return tree[fieldname]
-        else:
-            return id(tree[fieldname])
-
-    # Sanity check
-    sig = typegraph.signature_graph[node]
-    if type(sig) != tuple:
+    body = typegraph.struct_bodies.get(node)
+    if body is None:
         # TODO add error handling?
         raise SignatureMismatch()
+    body(tree, tree_id)
 
-    # Destructure this dictionary
-    subtype, *signature = sig
-    typegraph.instances[node].append(
-        (id(tree),
-         *[id_or_value(tree, fieldname, fieldtype)
-           for fieldname, fieldtype in signature]))
-
-    # Destructure recursive entries
-    for fieldname, fieldtype in signature:
-        if fieldtype not in ['Bool', 'Int', 'String']:
-            destructure(typegraph, fieldtype, tree[fieldname])
 
+def _destructure_dict(typegraph: Typegraph, node, tree, tree_id):
+    """ Destructure a dictionary, handling fields that differ from the typedef.
 
-def _destructure_dict(typegraph: Typegraph, node, tree):
+    The generated dict destructurers only come here when the fields differ.
+    """
     tree_fields = dict_fields(tree)
     type_fields = typegraph.fields[node]
     if tree_fields == type_fields:
-        _destructure_dict_1(typegraph, node, tree)
+        _destructure_dict_1(typegraph, node, tree, tree_id)
     elif set(tree_fields).issuperset(set(type_fields)):
         # Log a warning
         logging.warning('Input tree has unrecognized fields, collecting only '
@@ -171,7 +234,7 @@ def _destructure_dict(typegraph: Typegraph, node, tree):
         if specific_extra not in status_writer.input_sarif_extra["extra_info"]:
             status_writer.input_sarif_extra["extra_info"] += specific_extra
         status_writer.warning_set["input_sarif_extra"]+=1
-        _destructure_dict_1(typegraph, node, tree)
+        _destructure_dict_1(typegraph, node, tree, tree_id)
 
     elif set(tree_fields).issubset(set(type_fields)):
         # create a string list of the missing expected properties from the sarif
@@ -185,7 +248,7 @@ def _destructure_dict(typegraph: Typegraph, node, tree):
         difference = set(type_fields) - set(tree_fields)
         if "uriBaseId" in difference:
                 tree["uriBaseId"] = "default"
-                _destructure_dict_1(typegraph, node, tree)
+                _destructure_dict_1(typegraph, node, tree, tree_id)
         else:
             raise MissingFieldException(
                 f"(Sub)tree is missing fields required by typedef.\n"
@@ -199,7 +262,7 @@ def _destructure_dict(typegraph: Typegraph, node, tree):
         # possibly looks like: (Struct9699)type_fields: [codeflows...] vs tree_fields: [...extra_properties]
         # in that case we need to also try the Struct4055 signature here
         if "codeFlows" in type_fields:
-            _destructure_dict(typegraph, "Struct4055", tree)
+            _destructure_dict(typegraph, "Struct4055", tree, tree_id)
         else:
             status_writer.unknown_sarif_parsing_shape["extra_info"] = "type fields {} do not match tree fields {}.".format(type_fields, tree_fields)
             status_writer.csv_write(status_writer.unknown_sarif_parsing_shape)
@@ -208,7 +271,7 @@ def _destructure_dict(typegraph: Typegraph, node, tree):
                         .format(type_fields, tree_fields))
         
 
-def _destructure_list(typegraph, node: str, tree: List):
+def _destructure_list(typegraph, node: str, tree: List, tree_id):
     """
     """
     # List entries with multiple distinct signatures must be in order from most specific
@@ -245,42 +308,238 @@ def _destructure_list(typegraph, node: str, tree: List):
         In [957]: signature
         Out[957]: [(0, 'String')]
     """
+    for value, valueindex in zip(tree, range(0,len(tree))):
+        destructure_entry(typegraph, node, tree_id, valueindex, value)
+
+def destructure_entry(typegraph, node: str, tree_id, valueindex, value):
+    """ Destructure entry `valueindex` of the array `tree_id` of type `node`.
+
+    Streamed input uses this directly, one entry at a time.
+    """
+    typegraph.entry_destructurers[node](tree_id, valueindex, value)
+
+def _destructure_entry(typegraph, node: str, tree_id, valueindex, value):
+    """ destructure_entry() for arrays with several signatures.
+    """
     # Array entries use a fixed header with labeled entries:
     # (array_id, value_index, type_at_index, id_or_value_at_index)
 
     subtype, *signature = typegraph.signature_graph[node]
-    for value, valueindex in zip(tree, range(0,len(tree))):
-        for sigindex, sigtype in signature:
-            if sigtype in ['Bool', 'Int', 'String']:
-                # Destructure array leaf entries
+    value_id = None
+    for sigindex, sigtype in signature:
+        if sigtype not in ['Bool', 'Int', 'String']:
+            # Rows appended by a failed signature are dropped before the next one
+            lengths = {typedef: len(columns)
+                       for typedef, columns in typegraph.instances.items()}
+        if sigtype in ['Bool', 'Int', 'String']:
+            # Destructure array leaf entries
+            typegraph.instances[node].append(
+                (tree_id,
+                 valueindex, 
+                 sigtype,
+                 value))
+        else:
+            # Destructure recursive entries; retries keep the entry's id
+            if value_id is None:
+                value_id = typegraph.node_id(value)
+            try:
+                destructure(typegraph, sigtype, value, value_id)
                 typegraph.instances[node].append(
-                    (id(tree),
+                    (tree_id,
                      valueindex, 
                      sigtype,
-                     value))
-            else:
-                # Destructure recursive entries
-                try:
-                    destructure(typegraph, sigtype, value)
-                    typegraph.instances[node].append(
-                        (id(tree),
-                         valueindex, 
-                         sigtype,
-                         id(value)))
-                    # Next `value` on success
-                    break           
-                # status reporting under this handled already in each case
-                except MissingFieldException:
-                    # Re-raise if last available signature failed, otherwise try
-                    # next `signature`
-                    if (sigindex, sigtype) == signature[-1]:
-                        raise
+                     value_id))
+                # Next `value` on success
+                break           
+            # status reporting under this handled already in each case
+            except MissingFieldException:
+                # Re-raise if last available signature failed, otherwise try
+                # next `signature`
+                if (sigindex, sigtype) == signature[-1]:
+                    raise
+                for typedef, columns in typegraph.instances.items():
+                    columns.truncate(lengths[typedef])
+
+def dispatch_table(signature_graph, node):
+    """ Map the field set of each struct signature of array `node` to the typedef.
+
+    Field sets shared by several signatures are left out; entries with these
+    fields, or with fields matching no signature exactly, are handled by
+    _destructure_entry().
+    """
+    subtype, *signature = signature_graph[node]
+    typedefs = {}
+    for sigindex, sigtype in signature:
+        if sigtype.startswith('Struct'):
+            subtype, *sfields = signature_graph[sigtype]
+            keys = frozenset(fieldname for fieldname, fieldtype in sfields)
+            typedefs.setdefault(keys, []).append(sigtype)
+    return {keys: sigtypes[0] for keys, sigtypes in typedefs.items()
+            if len(sigtypes) == 1}
+
+#
+# Compiled destructurers
+#
+# For every typedef, compile_graph() generates python functions with the field
+# access, row construction and child dispatch written out for that typedef.
+# For a struct like
+#
+#     ('Struct2774', ('struct', ('text', 'String')))
+#
+# these are
+#
+#     def s_Struct2774(tree, tree_id):
+#         append_Struct2774((tree_id, tree['text']))
+#
+#     def d_Struct2774(tree, tree_id):
+#         if tree.keys() == k_Struct2774:
+#             s_Struct2774(tree, tree_id)
+#         else:
+#             _destructure_dict(tg, 'Struct2774', tree, tree_id)
+#
+# The source is generated and compiled once per signature graph; each
+# Typegraph binds its own copies to its instance lists.
+#
+_compiled_graphs = {}
+
+def compile_graph(signature_graph):
+    """ Return the (cached) binder for the destructurers of `signature_graph`.
+
+    Calling the binder with a Typegraph returns the dicts
+    (struct_bodies, dict_destructurers, list_destructurers, entry_destructurers),
+    each mapping typedef -> function.
+    """
+    key = tuple(signature_graph)
+    if key not in _compiled_graphs:
+        namespace = {}
+        exec(compile(_graph_source(signature_graph), "<typegraph>", "exec"),
+             globals(), namespace)
+        _compiled_graphs[key] = namespace['_bind']
+    return _compiled_graphs[key]
+
+_leaf_types = ('Bool', 'Int', 'String')
+
+def _child_call(fieldtype, child, child_id):
+    """ Source for destructuring `child` of type `fieldtype`, with a generic
+    fallback for values of unexpected type.
+    """
+    kind = 'dict' if fieldtype.startswith('Struct') else 'list'
+    call = 'd_' if kind == 'dict' else 'a_'
+    return ("if type({child}) is {kind}: {call}{ftype}({child}, {cid})\n"
+            "else: destructure(tg, {ftype!r}, {child}, {cid})"
+            .format(child=child, kind=kind, call=call, ftype=fieldtype, cid=child_id))
+
+def _append_row(graph, typedef, values):
+    """ Source appending the row of expressions `values` to the columns of `typedef`.
+    String literals are interned by the compiler already.
+    """
+    return "; ".join("append_{}_{}({})".format(
+        typedef, i, "_intern({})".format(value)
+        if kind == 'str' and not value.startswith("'") else value)
+                     for i, (kind, value)
+                     in enumerate(zip(column_kinds(graph, typedef), values)))
+
+def _indent(text, level):
+    return "".join("    " * level + line + "\n" for line in text.splitlines())
+
+def _graph_source(signature_graph):
+    graph = dict(signature_graph)
+    typedefs = [(typedef, sig) for typedef, sig in signature_graph
+                if typedef not in _leaf_types]
+    dispatch = []
+    lines = ["def _bind(tg):",
+             "    node_id = tg.node_id"]
+    for typedef, sig in typedefs:
+        for i in range(len(column_kinds(graph, typedef))):
+            lines.append("    append_{0}_{1} = tg.instances[{0!r}].columns[{1}].append"
+                         .format(typedef, i))
+        if typedef.startswith('Struct'):
+            subtype, *signature = sig
+            lines.append("    k_{} = frozenset({!r})".format(
+                typedef, [fieldname for fieldname, fieldtype in signature]))
+    for typedef, sig in typedefs:
+        subtype, *signature = sig
+        if typedef.startswith('Struct'):
+            # Row values in signature order, children after the row
+            row, children = [], []
+            for i, (fieldname, fieldtype) in enumerate(signature):
+                if fieldtype in _leaf_types:
+                    row.append("tree[{!r}]".format(fieldname))
+                else:
+                    row.append("i{}".format(i))
+                    children.append((i, fieldname, fieldtype))
+            body = ["c{0} = tree[{1!r}]; i{0} = node_id(c{0})".format(i, fieldname)
+                    for i, fieldname, fieldtype in children]
+            body.append(_append_row(graph, typedef, ["tree_id", *row]))
+            for i, fieldname, fieldtype in children:
+                body.append(_child_call(fieldtype, "c{}".format(i), "i{}".format(i)))
+            lines.append("    def s_{}(tree, tree_id):".format(typedef))
+            lines.append(_indent("\n".join(body), 2).rstrip("\n"))
+            lines.append(_indent(
+                "def d_{0}(tree, tree_id):\n"
+                "    if tree.keys() == k_{0}:\n"
+                "        s_{0}(tree, tree_id)\n"
+                "    else:\n"
+                "        _destructure_dict(tg, {0!r}, tree, tree_id)".format(typedef),
+                1).rstrip("\n"))
+        elif len(signature) == 1 and signature[0][1] in _leaf_types:
+            entry = _append_row(graph, typedef, ["tree_id", "index",
+                                                 repr(signature[0][1]), "value"])
+            lines.append(_indent(
+                "def e_{0}(tree_id, index, value):\n"
+                "    {1}\n"
+                "def a_{0}(tree, tree_id):\n"
+                "    for index, value in enumerate(tree):\n"
+                "        {1}".format(typedef, entry), 1).rstrip("\n"))
+        elif len(signature) == 1:
+            sigtype = signature[0][1]
+            entry = ("value_id = node_id(value)\n" +
+                     _child_call(sigtype, "value", "value_id") + "\n" +
+                     _append_row(graph, typedef, ["tree_id", "index", repr(sigtype),
+                                                  "value_id"]))
+            lines.append("    def e_{}(tree_id, index, value):".format(typedef))
+            lines.append(_indent(entry, 2).rstrip("\n"))
+            lines.append("    def a_{}(tree, tree_id):".format(typedef))
+            lines.append("        for index, value in enumerate(tree):")
+            lines.append(_indent(entry, 3).rstrip("\n"))
+        else:
+            # Several signatures: pick the struct by the entry's keys, see
+            # dispatch_table(); anything else tries them in order in
+            # _destructure_entry()
+            dispatch.append((typedef, dispatch_table(graph, typedef)))
+            lines.append(_indent(
+                "def e_{0}(tree_id, index, value):\n"
+                "    if type(value) is dict:\n"
+                "        match = m_{0}.get(frozenset(value))\n"
+                "        if match is not None:\n"
+                "            value_id = node_id(value)\n"
+                "            match[0](value, value_id)\n"
+                "            {1}\n"
+                "            return\n"
+                "    _destructure_entry(tg, {0!r}, tree_id, index, value)\n"
+                "def a_{0}(tree, tree_id):\n"
+                "    for index, value in enumerate(tree):\n"
+                "        e_{0}(tree_id, index, value)"
+                .format(typedef, _append_row(graph, typedef, ["tree_id", "index",
+                                                              "match[1]", "value_id"])),
+                1).rstrip("\n"))
+    # Struct bodies are called directly: the keys match the typedef exactly
+    for typedef, table in dispatch:
+        lines.append("    m_{} = {{{}}}".format(typedef, ", ".join(
+            "k_{0}: (s_{0}, {0!r})".format(sigtype) for sigtype in table.values())))
+    structs = [typedef for typedef, sig in typedefs if typedef.startswith('Struct')]
+    arrays = [typedef for typedef, sig in typedefs if not typedef.startswith('Struct')]
+    lines.append("    return ({{{}}},".format(", ".join("{0!r}: s_{0}".format(t) for t in structs)))
+    lines.append("            {{{}}},".format(", ".join("{0!r}: d_{0}".format(t) for t in structs)))
+    lines.append("            {{{}}},".format(", ".join("{0!r}: a_{0}".format(t) for t in arrays)))
+    lines.append("            {{{}}})".format(", ".join("{0!r}: e_{0}".format(t) for t in arrays)))
+    return "\n".join(lines) + "\n"
 
 #
 # Form tables from destructured json/sarif
 #
 def attach_tables(typegraph):
-    for typedef, valarray in typegraph.instances.items():
+    for typedef, columns in typegraph.instances.items():
         if typedef.startswith('Array'):
             # Arrays
             colheader = ('array_id', 'value_index', 'type_at_index', 'id_or_value_at_index')
@@ -289,7 +548,7 @@ def attach_tables(typegraph):
             colheader = ('struct_id', *typegraph.fields[typedef])
         else:
             continue            # skip String etc.
-        typegraph.dataframes[typedef] = pd.DataFrame(valarray, columns = colheader)
+        typegraph.dataframes[typedef] = columns.dataframe(colheader)
         
 
 def tagged_array_columns(typegraph, array_id):
@@ -316,3 +575,27 @@ def tagged_struct_columns(typegraph, struct_id):
     typedef = 'Struct' + struct_id
     colheader = ('struct_id', *typegraph.fields[typedef])
     return { header:"t{:s}_{:s}".format(struct_id, header) for header in colheader}
+
+def derived_frame(typegraph, name, make):
+    """ Return the dataframe `name` computed from the typegraph's tables by make().
+
+    make() is only called the first time; later calls return the same frame,
+    so the joins sharing it must not modify it.
+    """
+    if name not in typegraph.derived:
+        typegraph.derived[name] = make()
+    return typegraph.derived[name]
+
+def tagged_array(typegraph, array_id):
+    """ Return the dataframe of Array<array_id> with tagged_array_columns().
+    """
+    typedef = 'Array' + str(array_id)
+    return derived_frame(typegraph, 'tagged ' + typedef, lambda: typegraph.dataframes[typedef].rename(
+        columns = tagged_array_columns(typegraph, array_id), copy = False))
+
+def tagged_struct(typegraph, struct_id):
+    """ Return the dataframe of Struct<struct_id> with tagged_struct_columns().
+    """
+    typedef = 'Struct' + str(struct_id)
+    return derived_frame(typegraph, 'tagged ' + typedef, lambda: typegraph.dataframes[typedef].rename(
+        columns = tagged_struct_columns(typegraph, struct_id), copy = False))